@@ -2,11 +2,15 @@ import click
 import json
 import requests
 
+from script_tools.local_index import LocalIndex
+
 @click.command()
 @click.option("--query", prompt="Input query file", help="Input query file")
-@click.option("--index", prompt="target index", help="target index")
+@click.option("--index", prompt="target index", help="target index, or index folder for the local backend")
+@click.option("--backend", type=click.Choice(["elasticsearch", "local"]), default="elasticsearch",
+              help="search with Elasticsearch, or with an index folder written by script_tools/local_index.py")
 
-def doquery(query, index):
+def doquery(query, index, backend):
     MUST_NOT = '"must_not": { "match": { "FIELD": "VALUE" }}'
     MUST = '"must": { "match": { "FIELD": "VALUE" }}'
     RANGE = '"filter": { "range": { "FIELD": { OPVAL_LIST }}}'
@@ -40,6 +44,15 @@ def doquery(query, index):
                     opvals.append(f"\"lt\": {data[offset + 1]}")
                 offset += 2
             return RANGE.replace("FIELD", data[0]).replace("OPVAL_LIST", ",".join(opvals))
+    if backend == "local":
+        # only 'data is <words>' queries, a match query on the segment words
+        with open(query) as q:
+            lines = [line.split() for line in q if line[0] != '#' and line.strip()]
+        if not lines or any(line[:2] != ["data", "is"] for line in lines):
+            print("The local backend only supports 'data is ...' queries")
+        else:
+            print(json.dumps(LocalIndex(index).search(" ".join(word for line in lines for word in line[2:]))))
+        return
     with open(query) as q:
         qlines = [ qline(line) for line in q if line[0] != '#']
         if len(qlines) > 0:
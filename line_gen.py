@@ -1,5 +1,6 @@
 import click
-import gzip
+
+from script_tools.gzip_blocks import open_gzip
 
 @click.command()
 @click.option("--datasource", prompt="Source data file", help="Source data file")
@@ -12,15 +13,16 @@ def linegen(datasource, outfile, linelen, filter):
     def open_datasource(datasource):
         ext = datasource.split(".")[-1]
         if ext == "gz":
-            return gzip.open(datasource, "rt")
+            return open_gzip(datasource)
         else:
-            return open(datasource, "r")
+            return open(datasource, "rb")
 
     with open_datasource(datasource) as inFile:
         with open(outfile, "w") as outFile:
             buffer = ""
             for line in inFile:
-                line = line.strip()
+                # sequence data is ASCII, only the stripped line is decoded for the filter
+                line = line.strip().decode()
                 if not eval(filter):
                     buffer += line
                     while len(buffer) > linelen:
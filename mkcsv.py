@@ -28,7 +28,7 @@ def gen_data(target_folder):
             hits = search_data['hits']['hits']
             for hit in hits:
                 show_hit(species, chromosome, location, hit['_score'],
-                         hit['_source']['sp'], hit['_source']['chr'], hit['_source']['loc'],
+                         hit['_source']['sp'], hit['_source']['chr'], hit['_source'].get('segloc', hit['_source'].get('loc')),
                          reversed)
 
 
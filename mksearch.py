@@ -1,5 +1,7 @@
 import sys
 
+from script_tools.reverse_complement import revcomp
+
 filePath = sys.argv[1]
 targetFolder = sys.argv[2]
 species = sys.argv[3]
@@ -10,22 +12,6 @@ target_index = sys.argv[7]
 
 lines = open(filePath, "r").readlines()
 
-def comp(val):
-    if val == 'A':
-        return 'T'
-    elif val == 'C':
-        return 'G'
-    elif val == 'G':
-        return 'C'
-    elif val == 'T':
-        return 'A'
-    else:
-        return val
-
-def revcomp(s):
-    l = [comp(v) for v in reversed(s)]
-    return "".join(l)
-
 for line_number, line in enumerate(lines):
     location = line_number * sectionSize
     if len(line) > searchSize:
@@ -2,6 +2,8 @@ import requests
 import click
 import json
 
+from script_tools.reverse_complement import revcomp
+
 @click.command()
 @click.option("--query", prompt="query template", help="query template file")
 @click.option("--data", prompt="data file to use in query", help="data file to use in query")
@@ -13,20 +15,6 @@ import json
 @click.option("--listmod", prompt="list mods joined back into line", help="list mods joined back into line")
 
 def doquery(query, data, len, offset, index, linemod, splitmod, listmod):
-    def comp(val):
-        if val == 'A':
-            return 'T'
-        elif val == 'C':
-            return 'G'
-        elif val == 'G':
-            return 'C'
-        else:
-            return 'A'
-
-    def revcomp(s):
-        l = [comp(v) for v in s]
-        return "".join(l)
-
     with open(query) as fh:
         with open(data, "r") as dataFile:
             dataFile.seek(offset)
@@ -0,0 +1,235 @@
+"""
+Example: python async_sample_query.py --esurl http://localhost:9200 --index alltest --concurrency 16 "/genomes/alltest/samples/*.samples"
+
+Queries Elasticsearch with every sample of many sample files in one process, writing <sample file>.csv for each,
+with the same CSV rows as:
+
+python sample_query.py --esurl <esurl> --query <sample file> --index <index> > <sample file>.csv
+
+Up to 'concurrency' searches are sent at the same time over a pool of keep-alive connections, see es_client.py.
+Searches rejected because the cluster is busy (HTTP 429 or 503), or failing on a dropped connection,
+are retried after a pause.  When a search still fails, the CSV file of its sample file is not written, the other
+sample files are still queried, and the command exits with status 1 after listing the files not written.
+
+With --msearch N, up to N searches (and at most --msearchbytes bytes) are sent together in each _msearch
+request, and the responses are matched back to their samples by position.  stub_elasticsearch.py can be
+used to check and time this without a cluster.
+
+With --backend local or minhash, --index is an index folder written by local_index.py or minhash_index.py,
+searched in this process.
+
+With --format parquet or arrow, <sample file>.parquet or <sample file>.arrow is written instead of the CSV file,
+see results_store.py.
+"""
+import asyncio
+import click
+import json
+import os
+import sys
+import time
+
+from es_client import AsyncHttpClient, HttpError
+from file_patterns import expand_files
+from results_store import rows_frame, write_results
+from sample_query import LOCAL_BACKENDS, SEARCH_FILTER_PATH, csv_rows, read_samples, sample_search
+
+RETRY_STATUS = (429, 502, 503, 504)
+# _msearch responses keep their status, so an empty response is not removed from the list
+MSEARCH_FILTER_PATH = "responses.status,responses.error.type,responses.hits.hits._score,responses.hits.hits._source"
+MSEARCH_MAX_BYTES = 4 * 1024 * 1024
+
+
+async def with_retries(request, retries, pause=1.0):
+    """awaits 'request()', retrying with a doubling pause when the cluster is busy or a connection fails"""
+    for attempt in range(retries + 1):
+        try:
+            return await request()
+        except HttpError as e:
+            if e.status not in RETRY_STATUS or attempt == retries:
+                raise
+        except (ConnectionError, asyncio.TimeoutError):
+            if attempt == retries:
+                raise
+        await asyncio.sleep(pause * 2 ** attempt)
+
+
+async def search_rows(client, index, samples, retries):
+    """Returns a list of CSV rows for each of 'samples', one _search request each"""
+    async def search(sample):
+        status, body = await client.request("GET", f"/{index}/_search", sample_search(sample[4]),
+                                            params={"filter_path": SEARCH_FILTER_PATH})
+        return list(csv_rows(sample, json.loads(body)))
+    return [await with_retries(lambda: search(sample), retries) for sample in samples]
+
+
+def msearch_body(samples):
+    """_msearch NDJSON request body with a search for each of 'samples', the index is in the request path"""
+    return ''.join(f"{{}}\n{sample_search(sample[4])}\n" for sample in samples)
+
+
+def msearch_batches(samples, batch_size, max_bytes=MSEARCH_MAX_BYTES):
+    """Yields lists of (sampleIndex, sample), with up to 'batch_size' samples and 'max_bytes' of _msearch body"""
+    batch = []
+    batchBytes = 0
+    for i, sample in enumerate(samples):
+        sampleBytes = len(msearch_body([sample]))
+        if batch and (len(batch) == batch_size or batchBytes + sampleBytes > max_bytes):
+            yield batch
+            batch = []
+            batchBytes = 0
+        batch.append((i, sample))
+        batchBytes += sampleBytes
+    if batch:
+        yield batch
+
+
+async def msearch_rows(client, index, samples, retries, pause=1.0):
+    """Returns a list of CSV rows for each of 'samples', searched with one _msearch request.
+
+    Searches in the batch rejected because the cluster is busy are sent again, in a smaller _msearch request.
+    """
+    rows = [None] * len(samples)
+    pending = list(range(len(samples)))
+    for attempt in range(retries + 1):
+        body = msearch_body([samples[i] for i in pending])
+        status, response = await with_retries(
+            lambda: client.request("POST", f"/{index}/_msearch", body, params={"filter_path": MSEARCH_FILTER_PATH},
+                                   contentType="application/x-ndjson"), retries)
+        responses = json.loads(response)["responses"]
+        if len(responses) != len(pending):
+            raise ValueError(f"_msearch returned {len(responses)} responses for {len(pending)} searches")
+        busy = []
+        for i, searchResponse in zip(pending, responses):
+            if "error" not in searchResponse:
+                rows[i] = list(csv_rows(samples[i], searchResponse))
+            elif searchResponse.get("status") in RETRY_STATUS:
+                busy.append(i)
+            else:
+                raise HttpError(searchResponse.get("status"), json.dumps(searchResponse["error"]).encode())
+        if not busy:
+            return rows
+        pending = busy
+        await asyncio.sleep(pause * 2 ** attempt)
+    raise HttpError(429, f"{len(pending)} _msearch searches still rejected after {retries} retries".encode())
+
+
+def write_csv(file, rows, resultsFormat="csv"):
+    """writes the CSV rows for sample 'file' to '<file>.csv', with a temporary file and rename.
+
+    For a 'resultsFormat' of "parquet" or "arrow" the rows are written to '<file>.parquet' or '<file>.arrow'.
+    """
+    if resultsFormat != "csv":
+        write_results(rows_frame(row for sampleRows in rows for row in sampleRows), f"{file}.{resultsFormat}")
+        return
+    with open(f"{file}.csv.tmp", "w") as csvFile:
+        csvFile.writelines(f"{row}\n" for sampleRows in rows for row in sampleRows)
+    os.replace(f"{file}.csv.tmp", f"{file}.csv")
+
+
+async def query_files(esurl, index, files, concurrency, retries=5, batches=None, query_rows=search_rows, resultsFormat="csv"):
+    """Query with the samples of each of 'files', writing '<file>.csv' when all of its samples are done (see write_csv).
+
+    'batches(samples)' yields lists of (sampleIndex, sample) queried together with 'query_rows', by default one sample each.
+
+    Returns a dict of file to the exception of the files with a failed query, their CSV file is not written and
+    their other samples are not queried, the other files are.
+    """
+    if batches is None:
+        def batches(samples):
+            return ([(i, sample)] for i, sample in enumerate(samples))
+
+    start = time.perf_counter()
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+    done = 0
+    failures = {}
+
+    async with AsyncHttpClient(esurl, concurrency) as client:
+        async def worker():
+            nonlocal done
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                file, fileRows, remaining, batch = item
+                if file in failures:
+                    continue
+                try:
+                    rows = await query_rows(client, index, [sample for i, sample in batch], retries)
+                except Exception as e:
+                    # other searches of the file may already be sent, only the first failure is kept
+                    if file not in failures:
+                        failures[file] = e
+                        print(f"**** ERROR **** \"{file}\" not generated, {type(e).__name__}: {e}")
+                    continue
+                for (i, sample), sampleRows in zip(batch, rows):
+                    fileRows[i] = sampleRows
+                remaining[0] -= len(batch)
+                if remaining[0] == 0:
+                    write_csv(file, fileRows, resultsFormat)
+                    done += 1
+                    print(f"generated \"{file}.{resultsFormat}\" ({done} of {len(files)}), {time.perf_counter() - start:.1f} seconds")
+
+        workers = [asyncio.create_task(worker()) for i in range(concurrency)]
+        try:
+            for file in files:
+                samples = list(read_samples(file))
+                if not samples:
+                    write_csv(file, [], resultsFormat)
+                    done += 1
+                    continue
+                fileRows = [None] * len(samples)
+                remaining = [len(samples)]
+                for batch in batches(samples):
+                    await queue.put((file, fileRows, remaining, batch))
+            for task in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+    return failures
+
+
+def query_files_local(backend, indexFolder, files, resultsFormat="csv"):
+    """Query with the samples of each of 'files' in the index folder of a LOCAL_BACKENDS 'backend', writing '<file>.csv'"""
+    start = time.perf_counter()
+    index = LOCAL_BACKENDS[backend](indexFolder)
+    for done, file in enumerate(files, 1):
+        write_csv(file, [list(csv_rows(sample, index.search(sample[4]))) for sample in read_samples(file)], resultsFormat)
+        print(f"generated \"{file}.{resultsFormat}\" ({done} of {len(files)}), {time.perf_counter() - start:.1f} seconds")
+
+
+@click.command()
+@click.option("--esurl", help="Elasticsearch URL")
+@click.option("--index", prompt="target index", help="target index, or index folder for the local and minhash backends")
+@click.option("--concurrency", type=int, default=16, help="number of searches sent at the same time")
+@click.option("--retries", type=int, default=5, help="number of retries when the cluster is busy")
+@click.option("--msearch", type=int, default=0, help="number of searches in each _msearch request, 0 for a _search per sample")
+@click.option("--msearchbytes", type=int, default=MSEARCH_MAX_BYTES, help="maximum bytes in each _msearch request")
+@click.option("--backend", type=click.Choice(["elasticsearch", *LOCAL_BACKENDS]), default="elasticsearch",
+              help="search with Elasticsearch, or with an index folder written by local_index.py or minhash_index.py")
+@click.option("--format", "resultsFormat", type=click.Choice(["csv", "parquet", "arrow"]), default="csv",
+              help="format of the results file written for each sample file")
+@click.argument("files", nargs=-1)
+def doqueries(esurl, index, concurrency, retries, msearch, msearchbytes, backend, resultsFormat, files):
+    files = expand_files(files)
+    print(f"# querying with {len(files)} sample files")
+    if backend in LOCAL_BACKENDS:
+        query_files_local(backend, index, files, resultsFormat)
+    elif esurl is None:
+        raise click.UsageError("--esurl is needed for the elasticsearch backend")
+    else:
+        if msearch:
+            failures = asyncio.run(query_files(esurl, index, files, concurrency, retries,
+                                               lambda samples: msearch_batches(samples, msearch, msearchbytes), msearch_rows, resultsFormat))
+        else:
+            failures = asyncio.run(query_files(esurl, index, files, concurrency, retries, resultsFormat=resultsFormat))
+        if failures:
+            print(f"**** ERROR **** {len(failures)} of {len(files)} sample files not generated:")
+            for file in failures:
+                print(file)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    doqueries()
@@ -0,0 +1,268 @@
+"""
+Example: python bulk_load.py --esurl http://localhost:9200 --index alltest --workers 4 "/genomes/alltest/processed/*.processed"
+
+Loads the segments of .processed files (or .processed.gz) into an Elasticsearch index with _bulk requests,
+the same documents as SegmentWriter's .bulk.ndjson output: fields sp, chr, dSO, dEO, segloc, sEO, data and
+an _id from the species, chromosome, segment size, word length and segloc, so loading a file again replaces its
+documents.  The segment size and word length are from the <species>.<chromosome>.<segsize>.<wordlen>.processed
+file name written by processing.py.  A new index is created with the mapping from index_mapping.py.
+
+.bulk.ndjson files (or .bulk.ndjson.gz), written by processing.py with --bulk, are sent as they are, without
+making the _bulk entries from the segment lines again:
+
+python bulk_load.py --esurl http://localhost:9200 --index alltest "/genomes/alltest/processed/*.bulk.ndjson"
+
+Up to 'workers' _bulk requests are sent at the same time.  The request size starts at --batchbytes and adapts
+to how long requests take, it is halved when the cluster rejects a request as busy (HTTP 429).  Rejected requests,
+and documents rejected inside a request, are sent again after a pause.
+
+While loading, the index refresh_interval is -1 and number_of_replicas is 0 (unless --no-tuneindex), the previous
+settings are restored afterwards.  The documents indexed are counted from the status of each item in the _bulk
+responses, the load fails if the count for a species differs from the number of segment lines read.  Only the
+documents sent in this run are counted, so the index can already have other documents of the same species.  When
+done the index is refreshed, so there is no need to poll the index for the load to complete.
+"""
+import asyncio
+import click
+import json
+import os
+import sys
+import time
+from collections import Counter
+
+from async_sample_query import RETRY_STATUS, with_retries
+from es_client import AsyncHttpClient, HttpError
+from file_patterns import expand_files
+from gzip_blocks import open_gzip
+from index_mapping import INDEX_SHARDS, index_definition
+from processing import bulk_entry
+
+BULK_BATCH_BYTES = 8 * 1024 * 1024
+MIN_BATCH_BYTES = 256 * 1024
+MAX_BATCH_BYTES = 64 * 1024 * 1024
+# requests taking less than half of this grow the batch size, more than twice this shrink it
+BULK_TARGET_SECONDS = 2.0
+# items keep their status, so rejected documents can be matched to the request by position
+BULK_FILTER_PATH = "errors,items.*.status,items.*.error.type,items.*.error.reason"
+LOAD_SETTINGS = {"index.refresh_interval": "-1", "index.number_of_replicas": 0}
+
+
+class BatchSize:
+    """_bulk request size in bytes, grows while requests are fast and shrinks when they are slow or rejected"""
+    def __init__(self, size=BULK_BATCH_BYTES, minimum=MIN_BATCH_BYTES, maximum=MAX_BATCH_BYTES, targetSeconds=BULK_TARGET_SECONDS):
+        self.size = size
+        # a size outside the limits is where they start, so backing off never makes a request larger
+        self.minimum = min(minimum, size)
+        self.maximum = max(maximum, size)
+        self.targetSeconds = targetSeconds
+
+    def completed(self, seconds):
+        if seconds < self.targetSeconds / 2:
+            self.size = min(self.maximum, int(self.size * 1.5))
+        elif seconds > self.targetSeconds * 2:
+            self.size = max(self.minimum, self.size // 2)
+
+    def rejected(self):
+        self.size = max(self.minimum, self.size // 2)
+
+
+def processed_parameters(file):
+    """(segment size, word length) from the <species>.<chromosome>.<segsize>.<wordlen>.processed name of 'file'"""
+    name = os.path.basename(file)
+    name = name[:-len(".gz")] if name.endswith(".gz") else name
+    fields = name[:-len(".processed")].rsplit(".", 2) if name.endswith(".processed") else []
+    if len(fields) != 3 or not (fields[1].isdigit() and fields[2].isdigit()):
+        raise ValueError(f"{file} is not named <species>.<chromosome>.<segsize>.<wordlen>.processed, as written by processing.py")
+    return int(fields[1]), int(fields[2])
+
+
+def processed_entries(file):
+    """Yields (species, _bulk entry) for each segment line of .processed 'file'"""
+    if file.endswith(".hashed.processed"):
+        raise ValueError(f"{file} has word hashes instead of words, it cannot be loaded into Elasticsearch")
+    segmentSize, minWordSize = processed_parameters(file)
+    with (open_gzip(file) if file.endswith(".gz") else open(file, "rb")) as inFile:
+        for line in inFile:
+            fields = line.decode().rstrip("\n").split(" ", 6)
+            if len(fields) < 6:
+                continue
+            species, chromosome, dsSO, dsEO, fsSO, fsEO = fields[:6]
+            data = fields[6] if len(fields) == 7 else ""
+            if not data.strip():
+                # empty segments written at the end of a chromosome by earlier versions of processing.py
+                continue
+            yield species, bulk_entry(species, chromosome, int(dsSO), int(dsEO), int(fsSO), int(fsEO), data, segmentSize, minWordSize)
+
+
+def bulk_file_entries(file):
+    """Yields (species, _bulk entry) for each index action and document of .bulk.ndjson 'file'"""
+    decoder = json.JSONDecoder()
+    with (open_gzip(file) if file.endswith(".gz") else open(file, "rb")) as inFile:
+        for action, document in zip(inFile, inFile):
+            document = document.decode()
+            if not document.startswith('{"sp": '):
+                raise ValueError(f"{file} does not have the documents written by SegmentWriter")
+            # only the species is decoded, it is the first field of the document
+            species = decoder.raw_decode(document, len('{"sp": '))[0]
+            if document.endswith('"data": ""}\n'):
+                # empty segments written at the end of a chromosome by earlier versions of processing.py
+                continue
+            yield species, action.decode() + document
+
+
+def file_entries(file):
+    """Yields (species, _bulk entry) for each segment of a .processed or .bulk.ndjson 'file'"""
+    if file.endswith((".bulk.ndjson", ".bulk.ndjson.gz")):
+        return bulk_file_entries(file)
+    return processed_entries(file)
+
+
+def bulk_batches(files, batchSize):
+    """Yields lists of (species, _bulk entry) for 'files', each up to about 'batchSize.size' bytes"""
+    batch = []
+    batchBytes = 0
+    for file in files:
+        for species, entry in file_entries(file):
+            batch.append((species, entry))
+            batchBytes += len(entry)
+            if batchBytes >= batchSize.size:
+                yield batch
+                batch = []
+                batchBytes = 0
+    if batch:
+        yield batch
+
+
+async def send_bulk(client, index, batch, batchSize, retries, pause=1.0):
+    """Sends 'batch' in _bulk requests until every document is indexed, returns a Counter of documents per species,
+    from the status of each item in the responses"""
+    async def bulk(body):
+        start = time.perf_counter()
+        try:
+            status, response = await client.request("POST", f"/{index}/_bulk", body, params={"filter_path": BULK_FILTER_PATH},
+                                                    contentType="application/x-ndjson")
+        except HttpError as e:
+            if e.status in RETRY_STATUS:
+                batchSize.rejected()
+            raise
+        batchSize.completed(time.perf_counter() - start)
+        return json.loads(response)
+
+    indexed = Counter()
+    pending = batch
+    for attempt in range(retries + 1):
+        body = ''.join(entry for species, entry in pending)
+        response = await with_retries(lambda: bulk(body), retries, pause)
+        items = response.get("items", [])
+        if len(items) != len(pending):
+            raise ValueError(f"_bulk returned {len(items)} items for {len(pending)} documents")
+        busy = []
+        for (species, entry), item in zip(pending, items):
+            result = next(iter(item.values()))
+            if result["status"] < 300:
+                indexed[species] += 1
+            elif result["status"] in RETRY_STATUS:
+                busy.append((species, entry))
+            else:
+                raise HttpError(result["status"], json.dumps(result.get("error")).encode())
+        if not busy:
+            return indexed
+        batchSize.rejected()
+        pending = busy
+        await asyncio.sleep(pause * 2 ** attempt)
+    raise HttpError(429, f"{len(pending)} _bulk documents still rejected after {retries} retries".encode())
+
+
+async def index_settings(client, index, retries, shards=INDEX_SHARDS):
+    """Returns the index settings changed while loading, creating the index with the segment mapping if it does not exist"""
+    names = ",".join(LOAD_SETTINGS)
+    status, response = await with_retries(
+        lambda: client.request("GET", f"/{index}/_settings/{names}", params={"flat_settings": "true"}, okStatus=(200, 404)), retries)
+    if status == 404:
+        await with_retries(lambda: client.request("PUT", f"/{index}", json.dumps(index_definition(shards))), retries)
+        return {name: None for name in LOAD_SETTINGS}
+    settings = json.loads(response).get(index, {}).get("settings", {})
+    # settings that are not set are restored with null, their default
+    return {name: settings.get(name) for name in LOAD_SETTINGS}
+
+
+async def load_files(esurl, index, files, workers, retries=5, batchBytes=BULK_BATCH_BYTES, tuneIndex=True, shards=INDEX_SHARDS):
+    """Loads the segments of 'files' into 'index', returns (lines read, documents indexed), Counters by species"""
+    start = time.perf_counter()
+    batchSize = BatchSize(batchBytes)
+    queue = asyncio.Queue(maxsize=workers * 2)
+    read = Counter()
+    indexed = Counter()
+    failure = None
+
+    async with AsyncHttpClient(esurl, workers + 1) as client:
+        async def worker():
+            nonlocal failure
+            while True:
+                batch = await queue.get()
+                if batch is None:
+                    return
+                if failure is not None:
+                    continue
+                try:
+                    indexed.update(await send_bulk(client, index, batch, batchSize, retries))
+                except Exception as e:
+                    failure = e
+
+        previousSettings = await index_settings(client, index, retries, shards)
+        if tuneIndex:
+            await with_retries(lambda: client.request("PUT", f"/{index}/_settings", json.dumps(LOAD_SETTINGS)), retries)
+        tasks = [asyncio.create_task(worker()) for i in range(workers)]
+        try:
+            for batch in bulk_batches(files, batchSize):
+                read.update(species for species, entry in batch)
+                await queue.put(batch)
+                if failure is not None:
+                    raise failure
+            for task in tasks:
+                await queue.put(None)
+            await asyncio.gather(*tasks)
+            if failure is not None:
+                raise failure
+        finally:
+            for task in tasks:
+                task.cancel()
+            if tuneIndex:
+                await with_retries(lambda: client.request("PUT", f"/{index}/_settings", json.dumps(previousSettings)), retries)
+        print(f"sent {sum(indexed.values())} documents in {time.perf_counter() - start:.1f} seconds, "
+              f"last _bulk request size {batchSize.size} bytes")
+        await with_retries(lambda: client.request("POST", f"/{index}/_refresh"), retries)
+        return read, indexed
+
+
+@click.command()
+@click.option("--esurl", prompt="Elasticsearch URL", help="Elasticsearch URL")
+@click.option("--index", prompt="target index", help="target index")
+@click.option("--workers", type=int, default=4, help="number of _bulk requests sent at the same time")
+@click.option("--retries", type=int, default=5, help="number of retries when the cluster is busy")
+@click.option("--batchbytes", type=int, default=BULK_BATCH_BYTES, help="initial _bulk request size in bytes")
+@click.option("--tuneindex/--no-tuneindex", default=True, help="no refresh and replicas while loading")
+@click.option("--shards", type=int, default=INDEX_SHARDS, help="number of primary shards when the index is created")
+@click.argument("files", nargs=-1)
+def load(esurl, index, workers, retries, batchbytes, tuneindex, shards, files):
+    files = expand_files(files)
+    if not files:
+        print("**** ERROR **** no processed files to load")
+        sys.exit(1)
+    print(f"# loading {len(files)} processed files into {esurl}/{index}")
+    read, indexed = asyncio.run(load_files(esurl, index, files, workers, retries, batchbytes, tuneindex, shards))
+    if not read:
+        print(f"**** ERROR **** no segments in the {len(files)} processed files")
+        sys.exit(1)
+    complete = True
+    for species in sorted(read):
+        print(f"{species}: {read[species]} segments read, {indexed[species]} indexed in {index}")
+        complete = complete and indexed[species] == read[species]
+    if not complete:
+        print(f"**** ERROR **** {index} did not index every segment of the processed files")
+        sys.exit(1)
+    print(f"SUCCESSFULLY LOADED {sum(read.values())} segments into {index}")
+
+
+if __name__ == "__main__":
+    load()
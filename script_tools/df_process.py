@@ -1,4 +1,7 @@
-from itertools import product, combinations
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import combinations
+import hashlib
+import json
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
@@ -7,8 +10,16 @@ import seaborn
 import sys
 import os
 
+try:
+    from results_store import read_results, results_format
+except ImportError:
+    from script_tools.results_store import read_results, results_format
+
 style.use('ggplot')
 
+# content hashes of the graphs in an output folder, an unchanged graph is not drawn again
+GRAPH_HASHES_FILE = "graph_hashes.json"
+
 ordering = {
     "Gorilla_gorilla": ['1', '2A', '2B', '3', '4', '5', '6', '7', '8', '9', '10',
                         '11', '12', '13', '14', '15', '16', '17', '18', '19', '20',
@@ -32,6 +43,10 @@ ordering = {
 
 
 def load_df(csv_file):
+    """max score results, a max_score.py CSV file or a .parquet or .arrow results file (see results_store.py)"""
+    if results_format(csv_file) != "csv":
+        df = read_results(csv_file, columns=['sp', 'chr', 'loc', 'score', 'msp', 'mchr', 'mloc', 'orientation', 'segsize'])
+        return df.rename(columns={'loc': 'segloc'})
     df = pd.read_csv(csv_file,
                      compression='infer',
                      index_col=False,
@@ -46,49 +61,69 @@ def load_df(csv_file):
 
 
 def df_process(df):
-    l1, l2 = df['sp'].unique(), df['sp'].unique()
-    output = list(product(l1, l2))
-    for sp, msp in output:
-        spair_df = df[(df['sp'] == sp) & (df['msp'] == msp)]
-        for chr in spair_df['chr'].unique():
-            schr = spair_df[spair_df['chr'] == chr]
-            for mchr, xdf in schr.groupby('mchr'):
-                yield (sp, chr, msp, mchr, len(xdf))
+    """Yields (sp, chr, msp, mchr, count) for each pair of chromosomes with matches, between sampled species"""
+    yield from related_chromosome_df(df).itertuples(index=False, name=None)
 
 
 def related_chromosome_df(df):
-    return pd.DataFrame(df_process(df), columns=['sp', 'chr', 'msp', 'mchr', 'count'])
+    """DataFrame with the number of matches of each (sp, chr, msp, mchr), in one groupby"""
+    df = df[df['msp'].isin(df['sp'].unique())]
+    counts = df.groupby(['sp', 'chr', 'msp', 'mchr'], observed=True, sort=True).size()
+    return counts.rename('count').reset_index()
+
+
+def chromosome_codes(chromosomes, labels):
+    """position of each of 'chromosomes' in 'labels', -1 for chromosomes not in it"""
+    return pd.Index(labels).get_indexer(chromosomes).astype(np.int64)
 
 
 def vals(cdf, row_labels, col_labels):
     result = np.zeros(len(row_labels), int)
-    for index, row in cdf.iterrows():
-        if row['chr'] in row_labels:
-            result[row_labels.index(row['chr'])] = int(row['count'])
+    codes = chromosome_codes(cdf['chr'], row_labels)
+    found = codes >= 0
+    result[codes[found]] = cdf['count'].to_numpy()[found].astype(int)
     return result
 
 
-def gen_graph(df, sp, msp, out_directory):
+def confusion_matrices(df, count=None):
+    """Dict of (sp, msp) to a dense array of match counts, rows in ordering[sp] order and columns in ordering[msp] order.
+
+    'df' has a row for each match, or with 'count' the name of a column with the number of matches of each row.
+    Chromosomes not in 'ordering' are left out.
+    """
+    matrices = {}
+    for (sp, msp), pair in df.groupby(['sp', 'msp'], observed=True):
+        if sp not in ordering or msp not in ordering:
+            continue
+        rows = chromosome_codes(pair['chr'], ordering[sp])
+        columns = chromosome_codes(pair['mchr'], ordering[msp])
+        found = (rows >= 0) & (columns >= 0)
+        weights = pair[count].to_numpy()[found] if count is not None else None
+        size = len(ordering[sp]) * len(ordering[msp])
+        cells = np.bincount(rows[found] * len(ordering[msp]) + columns[found], weights, minlength=size)
+        matrices[(sp, msp)] = cells.astype(int).reshape(len(ordering[sp]), len(ordering[msp]))
+    return matrices
+
+
+def graph_file(out_directory, sp, msp):
+    return f"{out_directory}/{sp}_vs_{msp}.png"
+
+
+def graph_hash(matrix, sp, msp):
+    """sha256 hex digest of what the graph of 'matrix' shows, its species, chromosome labels and counts"""
+    sha256 = hashlib.sha256(json.dumps([sp, msp, ordering[sp], ordering[msp]]).encode())
+    sha256.update(np.ascontiguousarray(matrix, dtype=np.int64).tobytes())
+    return sha256.hexdigest()
+
+
+def gen_graph(matrix, sp, msp, out_directory):
+    """heatmap of 'matrix' from confusion_matrices, rows from sp, columns from msp"""
     sp_labels = ordering[sp]
     msp_labels = ordering[msp]
 
-    out_file = f"{out_directory}/{sp}_vs_{msp}.png"
-    print(f"  generate {out_file}")
-    cm_df = df[(df['sp'] == sp) & (df['msp'] == msp)]
-
-    # creating a DataFrame with rows from sp, columns from msp
-    # first create a dictionary with keys from msp, these will be the columns
-    #d = {key: vals(cm_df[cm_df['mchr'] == key], sp_labels, msp_labels) for key in msp_labels}
-    d = {}
-    mask = np.zeros(shape=(len(msp_labels), len(sp_labels)))
-    for i, key in enumerate(msp_labels):
-        xdf = cm_df[cm_df['mchr'] == key]
-        v = vals(xdf, sp_labels, msp_labels)
-        mask[i][v == 0] = 1
-        d[key] = v
-    ddf = pd.DataFrame(d)
-    ddf.index = sp_labels
-    mask = mask.T
+    out_file = graph_file(out_directory, sp, msp)
+    ddf = pd.DataFrame(matrix, index=sp_labels, columns=msp_labels)
+    mask = matrix == 0
 
     fig, ax = plt.subplots(figsize=(10, 10))
     ax.tick_params(axis=u'both', which=u'both', length=0)
@@ -99,11 +134,23 @@ def gen_graph(df, sp, msp, out_directory):
     plt.ylabel(sp, fontsize='large', fontweight='bold')
     plt.xlabel(msp, fontsize='large', fontweight='bold')
     plt.title(f"Chromosome Relationships", fontstyle='italic')
-    plt.savefig(f"{out_file}")
+    fig.savefig(f"{out_file}")
+    plt.close(fig)
+    return out_file
+
+
+def render_graph(matrix, sp, msp, out_directory):
+    """gen_graph in a worker process, drawing without a display"""
+    plt.switch_backend("Agg")
+    return gen_graph(matrix, sp, msp, out_directory)
+
 
+def gen_chromosome_graphs(in_file, out_directory, workers=None):
+    """draws the graph of every pair of species in the counts of 'in_file' with 'workers' processes.
 
-def gen_chromosome_graphs(in_file, out_directory):
-    df = pd.read_csv(in_file)
+    Graphs are skipped when their file exists and the hash of their data is the one in GRAPH_HASHES_FILE.
+    """
+    df = pd.read_csv(in_file, dtype={'chr': str, 'mchr': str})
     chr_series = df['chr'].apply(lambda x: x.upper())
     mchr_series = df['mchr'].apply(lambda x: x.upper())
     df.insert(0, 'hsf', chr_series)
@@ -114,15 +161,41 @@ def gen_chromosome_graphs(in_file, out_directory):
     df = df.rename(columns={"hsf": "mchr"})
     df = df.astype({"count": int})
     species = df['sp'].unique()
-    for sp1, sp2 in combinations(species, 2):
-        gen_graph(df, sp1, sp2, out_directory)
-        gen_graph(df, sp2, sp1, out_directory)
+    matrices = confusion_matrices(df, count='count')
+    hashes_file = f"{out_directory}/{GRAPH_HASHES_FILE}"
+    try:
+        with open(hashes_file) as inFile:
+            previous_hashes = json.load(inFile)
+    except (OSError, ValueError):
+        previous_hashes = {}
+    hashes = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for sp1, sp2 in combinations(species, 2):
+            for sp, msp in [(sp1, sp2), (sp2, sp1)]:
+                matrix = matrices.get((sp, msp))
+                if matrix is None:
+                    matrix = np.zeros((len(ordering[sp]), len(ordering[msp])), int)
+                out_file = graph_file(out_directory, sp, msp)
+                name = os.path.basename(out_file)
+                hashes[name] = graph_hash(matrix, sp, msp)
+                if previous_hashes.get(name) == hashes[name] and os.path.exists(out_file):
+                    print(f"  unchanged {out_file}")
+                    continue
+                futures[executor.submit(render_graph, matrix, sp, msp, out_directory)] = name
+        for future in as_completed(futures):
+            print(f"  generate {future.result()}")
+    with open(f"{hashes_file}.tmp", "w") as outFile:
+        json.dump(hashes, outFile, indent=2)
+    os.replace(f"{hashes_file}.tmp", hashes_file)
 
 
 if __name__ == "__main__":
     in_file = sys.argv[1]
     out_directory = sys.argv[2]
+    # number of processes drawing graphs, defaults to the number of CPUs
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else None
     if not os.path.exists(out_directory):
         print(f"PATH {out_directory} does not exist, CREATING IT")
         os.mkdir(out_directory)
-    gen_chromosome_graphs(in_file, out_directory)
+    gen_chromosome_graphs(in_file, out_directory, workers)
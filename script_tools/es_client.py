@@ -0,0 +1,117 @@
+"""
+Minimal asyncio HTTP/1.1 client for Elasticsearch requests, with a pool of keep-alive connections.
+
+Only the standard library is used.  Requests have a JSON or NDJSON body and the whole response body is
+returned, responses with a Content-Length or chunked transfer encoding are supported.
+
+Example:
+
+    async def count(url, index):
+        async with AsyncHttpClient(url, maxConnections=8) as client:
+            status, body = await client.request("GET", f"/{index}/_count")
+            return json.loads(body)["count"]
+"""
+import asyncio
+import ssl
+from urllib.parse import urlencode, urlsplit
+
+
+class HttpError(Exception):
+    def __init__(self, status, body):
+        super().__init__(f"HTTP status {status}: {body[:200]!r}")
+        self.status = status
+        self.body = body
+
+
+class AsyncHttpClient:
+    def __init__(self, url, maxConnections=16, timeout=300):
+        parts = urlsplit(url if "://" in url else f"http://{url}")
+        self.host = parts.hostname
+        self.useSsl = parts.scheme == "https"
+        self.port = parts.port or (443 if self.useSsl else 80)
+        self.timeout = timeout
+        self.connections = asyncio.Semaphore(maxConnections)
+        self.idle = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        while self.idle:
+            reader, writer = self.idle.pop()
+            writer.close()
+
+    async def connect(self):
+        if self.idle:
+            return self.idle.pop(), True
+        connection = await asyncio.open_connection(self.host, self.port, ssl=ssl.create_default_context() if self.useSsl else None)
+        return connection, False
+
+    async def request(self, method, path, body=b'', params=None, contentType="application/json", okStatus=(200, 201)):
+        """Returns (status, responseBody) for the request, raises HttpError for a status not in 'okStatus'"""
+        if params:
+            path = f"{path}?{urlencode(params)}"
+        if isinstance(body, str):
+            body = body.encode()
+        head = (f"{method} {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\nContent-Type: {contentType}\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: keep-alive\r\n\r\n").encode()
+        async with self.connections:
+            while True:
+                (reader, writer), reused = await self.connect()
+                try:
+                    writer.write(head + body)
+                    status, keepAlive, responseBody = await asyncio.wait_for(self.read_response(reader), self.timeout)
+                    break
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    writer.close()
+                    # the server may have closed an idle connection, then a new connection is used
+                    if not reused:
+                        raise
+                except BaseException:
+                    writer.close()
+                    raise
+            if keepAlive:
+                self.idle.append((reader, writer))
+            else:
+                writer.close()
+        if status not in okStatus:
+            raise HttpError(status, responseBody)
+        return status, responseBody
+
+    @staticmethod
+    async def read_response(reader):
+        """Returns (status, keepAlive, body) read from 'reader'"""
+        statusLine = await reader.readline()
+        if not statusLine:
+            raise ConnectionResetError("connection closed before the response")
+        status = int(statusLine.split()[1])
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, value = line.decode("latin-1").split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    # trailers end with an empty line
+                    while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            body = b''.join(chunks)
+        elif "content-length" in headers:
+            body = await reader.readexactly(int(headers["content-length"]))
+        else:
+            # the body ends when the connection is closed
+            body = await reader.read()
+            headers["connection"] = "close"
+        keepAlive = headers.get("connection", "").lower() != "close"
+        return status, keepAlive, body
@@ -0,0 +1,13 @@
+"""
+File arguments of the command line tools:  file names, or glob patterns like "/genomes/alltest/samples/*.samples"
+quoted so the shell does not expand them, which is not limited by the length of the command line.
+"""
+import glob
+
+
+def expand_files(file_patterns):
+    """files for each file name or glob pattern, in order"""
+    files = []
+    for pattern in file_patterns:
+        files.extend(sorted(glob.glob(pattern)) if any(c in pattern for c in "*?[") else [pattern])
+    return files
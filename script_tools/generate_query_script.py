@@ -11,9 +11,5 @@ files_to_process = glob.glob(sample_file_pattern)
 print(f"# Sample File Pattern '{sample_file_pattern}'")
 print(f"# .. found {len(files_to_process)} files to process")
 
-total = len(files_to_process)
-counter = 0
-for file in files_to_process:
-    counter += 1
-    print(f"echo 'generate \"{file}.csv\" ({counter} of {total})'")
-    print(f"python {tool_path}/sample_query.py --esurl {elasticsearch_url} --query {file} --index {index} > {file}.csv")
+# all sample files are queried by one process, see async_sample_query.py
+print(f"python {tool_path}/async_sample_query.py --esurl {elasticsearch_url} --index {index} \"{sample_file_pattern}\"")
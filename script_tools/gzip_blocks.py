@@ -0,0 +1,166 @@
+"""
+Reads gzip compressed data sources as binary data, decompressed in large blocks.
+
+gzip.open(filePath, "rt") decompresses through the gzip module's reader and a text wrapper, one line at
+a time.  Here compressed data is read in large blocks and decompressed with zlib, without decoding text,
+since sequence data is ASCII.
+
+BGZF files (written by bgzip, e.g. most indexed genome downloads) are a series of independent gzip members
+of at most 64KB, these are decompressed in parallel threads (zlib releases the GIL while decompressing).
+
+Example:
+
+    with open_gzip("chr1.fa.gz") as inFile:
+        block = inFile.read(256 * 1024)
+"""
+import io
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+COMPRESSED_READ_SIZE = 1024 * 1024
+# number of BGZF members decompressed together, each is at most 64KB decompressed
+BGZF_BATCH_SIZE = 256
+
+
+def bgzf_block_size(header, extra):
+    """Returns the size of the BGZF member with gzip 'header' and 'extra' field, or None if it is not BGZF"""
+    if header[:3] != b'\x1f\x8b\x08' or not header[3] & 4:
+        return None
+    offset = 0
+    while offset + 4 <= len(extra):
+        subfieldLength = struct.unpack_from('<H', extra, offset + 2)[0]
+        if extra[offset:offset + 2] == b'BC' and subfieldLength == 2:
+            return struct.unpack_from('<H', extra, offset + 4)[0] + 1
+        offset += 4 + subfieldLength
+    return None
+
+
+def is_bgzf(filePath):
+    """True if 'filePath' starts with a BGZF member"""
+    with open(filePath, "rb") as inFile:
+        header = inFile.read(12)
+        if len(header) < 12:
+            return False
+        extra = inFile.read(struct.unpack_from('<H', header, 10)[0])
+    return bgzf_block_size(header, extra) is not None
+
+
+def bgzf_members(inFile):
+    """Yields (compressedData, crc, size) for each BGZF member in 'inFile'"""
+    while True:
+        header = inFile.read(12)
+        if not header:
+            return
+        extraLength = struct.unpack_from('<H', header, 10)[0]
+        extra = inFile.read(extraLength)
+        blockSize = bgzf_block_size(header, extra)
+        if blockSize is None:
+            raise ValueError(f"{inFile.name} is not a BGZF file, a member has no block size")
+        member = inFile.read(blockSize - 12 - extraLength)
+        crc, size = struct.unpack_from('<II', member, len(member) - 8)
+        yield member[:-8], crc, size
+
+
+def inflate_bgzf_member(member):
+    """decompressed data of a member from bgzf_members"""
+    compressedData, crc, size = member
+    data = zlib.decompress(compressedData, -zlib.MAX_WBITS, size)
+    if len(data) != size or zlib.crc32(data) != crc:
+        raise ValueError("BGZF member CRC or size does not match its data")
+    return data
+
+
+def bgzf_blocks(filePath, threads=None):
+    """Yields decompressed data of BGZF file 'filePath', in blocks of up to BGZF_BATCH_SIZE members"""
+    with open(filePath, "rb", buffering=COMPRESSED_READ_SIZE) as inFile, ThreadPoolExecutor(max_workers=threads) as executor:
+        members = bgzf_members(inFile)
+        # one batch is decompressed while the previous one is used
+        batch = [executor.submit(inflate_bgzf_member, member) for i, member in zip(range(BGZF_BATCH_SIZE), members)]
+        while batch:
+            nextBatch = [executor.submit(inflate_bgzf_member, member) for i, member in zip(range(BGZF_BATCH_SIZE), members)]
+            yield b''.join(future.result() for future in batch)
+            batch = nextBatch
+
+
+def gzip_blocks(filePath):
+    """Yields decompressed data of gzip file 'filePath', which can have more than one member"""
+    with open(filePath, "rb") as inFile:
+        decompressor = None
+        while True:
+            compressedData = inFile.read(COMPRESSED_READ_SIZE)
+            if not compressedData:
+                break
+            while compressedData:
+                if decompressor is None:
+                    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                data = decompressor.decompress(compressedData)
+                if data:
+                    yield data
+                compressedData = b''
+                if decompressor.eof:
+                    # the next member, padding after the last member is ignored, the same as the gzip module
+                    compressedData = decompressor.unused_data.lstrip(b'\x00')
+                    decompressor = None
+        if decompressor is not None:
+            raise EOFError(f"{filePath} ended before the end of the compressed data")
+
+
+def decompressed_blocks(filePath, threads=None):
+    """Yields decompressed data of gzip or BGZF file 'filePath', using up to 'threads' threads for BGZF"""
+    if is_bgzf(filePath):
+        return bgzf_blocks(filePath, threads)
+    return gzip_blocks(filePath)
+
+
+class GzipBlockReader(io.RawIOBase):
+    """Unbuffered binary reader of decompressed blocks, only seeking forward is supported"""
+    def __init__(self, filePath, threads=None):
+        self.name = filePath
+        self.blocks = decompressed_blocks(filePath, threads)
+        self.block = memoryview(b'')
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.block:
+            block = next(self.blocks, None)
+            if block is None:
+                return 0
+            self.block = memoryview(block)
+        size = min(len(buffer), len(self.block))
+        buffer[:size] = self.block[:size]
+        self.block = self.block[size:]
+        self.position += size
+        return size
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence != io.SEEK_SET:
+            raise io.UnsupportedOperation("only seeking from the start or current position is supported")
+        if offset < self.position:
+            raise io.UnsupportedOperation("only seeking forward is supported")
+        while self.position < offset:
+            skipped = len(self.read(min(offset - self.position, COMPRESSED_READ_SIZE)))
+            if not skipped:
+                break
+        return self.position
+
+    def close(self):
+        if not self.closed:
+            self.blocks.close()
+        super().close()
+
+
+def open_gzip(filePath, threads=None, bufferSize=COMPRESSED_READ_SIZE):
+    """Returns a buffered binary file object for the decompressed data of gzip or BGZF file 'filePath'"""
+    return io.BufferedReader(GzipBlockReader(filePath, threads), bufferSize)
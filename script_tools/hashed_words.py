@@ -0,0 +1,83 @@
+"""
+Words as 64 bit hashes, and the binary .hashed.processed and .hashed.samples files written by processing.py with
+them (see HashedSegmentWriter), searched with local_index.py or minhash_index.py.
+
+Words are split on whitespace like the Elasticsearch whitespace analyzer, including its 255 character limit.
+"""
+import json
+import struct
+
+import numpy as np
+
+# the whitespace tokenizer splits longer words
+MAX_TOKEN_LENGTH = 255
+
+HASH_MULTIPLIER = 0x100000001B3
+HASH_INVERSE = pow(HASH_MULTIPLIER, -1, 2 ** 64)
+
+# .hashed.processed and .hashed.samples files have a JSON header line with the species and chromosome, then records
+# of these fields followed by the number of words given as little endian uint64 word hashes
+HASHED_SEGMENT = struct.Struct("<qqqqI")  # dsSO, dsEO, fsSO, fsEO, number of words
+HASHED_SAMPLE = struct.Struct("<qqqqBII")  # dsSO, dsEO, fsSO, fsEO, orientation, length of the sample text, number of words
+ORIENTATIONS = ["same", "reversed"]
+
+
+def word_spans(values):
+    """Returns (starts, ends) of the whitespace separated words in uint8 array 'values', split at MAX_TOKEN_LENGTH"""
+    isWord = np.empty(len(values) + 2, dtype=np.int8)
+    isWord[0] = isWord[-1] = 0
+    isWord[1:-1] = values > 32
+    changes = np.flatnonzero(np.diff(isWord))
+    starts, ends = changes[::2], changes[1::2]
+    chunks = (ends - starts + MAX_TOKEN_LENGTH - 1) // MAX_TOKEN_LENGTH
+    if len(chunks) and chunks.max() > 1:
+        wordStarts = np.repeat(starts, chunks)
+        first = np.repeat(np.cumsum(chunks) - chunks, chunks)
+        starts = wordStarts + (np.arange(len(wordStarts)) - first) * MAX_TOKEN_LENGTH
+        ends = np.minimum(starts + MAX_TOKEN_LENGTH, np.repeat(ends, chunks))
+    return starts, ends
+
+
+def splitmix64(h):
+    """mixes the bits of uint64 array 'h', so similar words have unrelated hashes"""
+    h = (h ^ (h >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    h = (h ^ (h >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return h ^ (h >> np.uint64(31))
+
+
+def word_hashes(data):
+    """uint64 hash of each word of 'data', bytes with whitespace separated words.
+
+    A polynomial hash of each word is the difference of prefix sums, scaled by an inverse power of the multiplier,
+    so all words are hashed together with uint64 arithmetic (modulo 2**64).
+    """
+    values = np.frombuffer(data, dtype=np.uint8)
+    starts, ends = word_spans(values)
+    if not len(starts):
+        return np.empty(0, dtype=np.uint64)
+    powers = np.full(len(values) + 1, HASH_MULTIPLIER, dtype=np.uint64)
+    powers[0] = 1
+    powers = np.cumprod(powers)
+    inverses = np.full(len(values) + 1, HASH_INVERSE, dtype=np.uint64)
+    inverses[0] = 1
+    inverses = np.cumprod(inverses)
+    prefix = np.zeros(len(values) + 1, dtype=np.uint64)
+    np.cumsum(values * powers[:-1], out=prefix[1:])
+    h = (prefix[ends] - prefix[starts]) * inverses[starts]
+    return splitmix64(h ^ (ends - starts).astype(np.uint64))
+
+
+def write_hashed_header(outFile, species, chromosome):
+    outFile.write(json.dumps({"species": species, "chromosome": chromosome}).encode() + b"\n")
+
+
+def hashed_records(file, record):
+    """Yields (header, fields, hashes) for each 'record' struct and its word hashes in .hashed.processed or .hashed.samples 'file'"""
+    with open(file, "rb") as inFile:
+        header = json.loads(inFile.readline())
+        while True:
+            packed = inFile.read(record.size)
+            if len(packed) < record.size:
+                return
+            fields = record.unpack(packed)
+            yield header, fields, np.frombuffer(inFile.read(8 * fields[-1]), dtype="<u8").astype(np.uint64)
@@ -0,0 +1,64 @@
+"""
+Example: python index_mapping.py --esurl http://localhost:9200 --index alltest --shards 2
+
+Creates the Elasticsearch index for segment documents with an explicit mapping, instead of the dynamic mapping
+of the first document loaded:
+
+- data, the segment words, uses the whitespace analyzer (words are uppercase sequence data), only term frequencies
+  are indexed (no positions, phrase queries are not used) and it is not kept in _source, searches only need the
+  other fields
+- sp and chr are keywords, the offsets are numbers with doc_values, none of them have a text or .keyword sub-field
+
+bulk_load.py creates the index the same way when it does not exist.  With --recreate an existing index is deleted first.
+"""
+import click
+import json
+import requests
+
+INDEX_SHARDS = 1
+
+SEGMENT_MAPPINGS = {
+    "dynamic": "strict",
+    "_source": {"excludes": ["data"]},
+    "properties": {
+        "sp": {"type": "keyword"},
+        "chr": {"type": "keyword"},
+        # offsets in the filtered sequence of a chromosome
+        "segloc": {"type": "integer"},
+        "sEO": {"type": "integer"},
+        # offsets in the data source file, a file can be larger than 2GB
+        "dSO": {"type": "long"},
+        "dEO": {"type": "long"},
+        "data": {"type": "text", "analyzer": "whitespace", "index_options": "freqs"},
+    }
+}
+
+
+def index_definition(shards=INDEX_SHARDS, replicas=None):
+    """body of the create index request for segment documents"""
+    settings = {"number_of_shards": shards}
+    if replicas is not None:
+        settings["number_of_replicas"] = replicas
+    return {"settings": {"index": settings}, "mappings": SEGMENT_MAPPINGS}
+
+
+@click.command()
+@click.option("--esurl", prompt="Elasticsearch URL", help="Elasticsearch URL")
+@click.option("--index", prompt="target index", help="target index")
+@click.option("--shards", type=int, default=INDEX_SHARDS, help="number of primary shards")
+@click.option("--replicas", type=int, help="number of replicas, the cluster default when not given")
+@click.option("--recreate/--no-recreate", default=False, help="delete the index first if it exists")
+def create_index(esurl, index, shards, replicas, recreate):
+    headers = {'content-type': 'application/json'}
+    if recreate:
+        response = requests.delete(f"{esurl}/{index}")
+        if response.status_code not in (200, 404):
+            raise click.ClickException(f"could not delete {index}: {response.text}")
+    response = requests.put(f"{esurl}/{index}", data=json.dumps(index_definition(shards, replicas)), headers=headers)
+    if response.status_code != 200:
+        raise click.ClickException(f"could not create {index}: {response.text}")
+    print(f"created {index} with {shards} shards")
+
+
+if __name__ == "__main__":
+    create_index()
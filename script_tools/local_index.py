@@ -0,0 +1,276 @@
+"""
+Example: python local_index.py --folder /genomes/alltest/local_index "/genomes/alltest/processed/*.processed"
+
+On-disk inverted index of .processed segments, searched in process instead of with Elasticsearch:
+
+python sample_query.py --backend local --index /genomes/alltest/local_index --query <sample file> > <sample file>.csv
+
+The CSV rows are the same as with an Elasticsearch index created by index_mapping.py (one shard):  words are
+split on whitespace like the whitespace analyzer (including its 255 character limit), a search scores every
+segment with a word of the sample with Lucene's BM25 (k1 1.2, b 0.75, one byte field length norms, float scores)
+and the top 10 segments are returned, in the same shape as an Elasticsearch search response.
+
+Index files in 'folder':
+
+- terms.npy, sorted 64 bit hashes of the words
+- postings.bin, for each word the segments it is in, as varint (segment number delta, frequency) pairs
+- postings_offsets.npy, doc_freqs.npy, where each word's postings start in postings.bin and how many segments it is in
+- segments.npy, the fields of each segment and its field length norm
+- index.json, species and chromosome names, the number of segments and words, written last
+
+The .npy files and postings.bin are memory mapped, so only the postings of the words searched for are read.
+
+The index can also be built from .hashed.processed files and searched with the samples of .hashed.samples files,
+written by processing.py with the words as hashes (see HashedSegmentWriter), then no words are split or hashed here.
+"""
+import click
+import json
+import math
+import os
+import time
+
+import numpy as np
+
+try:
+    from file_patterns import expand_files
+    from hashed_words import HASHED_SAMPLE, HASHED_SEGMENT, ORIENTATIONS, hashed_records, word_hashes
+except ImportError:
+    from script_tools.file_patterns import expand_files
+    from script_tools.hashed_words import HASHED_SAMPLE, HASHED_SEGMENT, ORIENTATIONS, hashed_records, word_hashes
+
+BM25_K1 = np.float32(1.2)
+BM25_B = np.float32(0.75)
+# Elasticsearch 7 BM25 scores are multiplied by k1 + 1
+BM25_BOOST = np.float32(1) * (np.float32(1) + BM25_K1)
+SEARCH_SIZE = 10
+
+SEGMENT_FIELDS = [("sp", np.uint32), ("chr", np.uint32), ("dSO", np.int64), ("dEO", np.int64),
+                  ("segloc", np.int64), ("sEO", np.int64), ("norm", np.uint8)]
+INDEX_FILES = ["terms.npy", "postings_offsets.npy", "doc_freqs.npy", "segments.npy", "postings.bin"]
+
+
+def int4_to_long(i):
+    bits = i & 0x07
+    shift = (i >> 3) - 1
+    return bits if shift == -1 else (bits | 0x08) << shift
+
+
+def long_to_int4(i):
+    numberBits = i.bit_length()
+    if numberBits < 4:
+        return i
+    shift = numberBits - 4
+    return ((i >> shift) & 0x07) | ((shift + 1) << 3)
+
+
+# Lucene's SmallFloat.intToByte4, field lengths are stored in one byte, exact up to 24
+NORM_FREE_VALUES = 255 - long_to_int4(2 ** 31 - 1)
+NORM_LENGTHS = np.array([i if i < NORM_FREE_VALUES else NORM_FREE_VALUES + int4_to_long(i - NORM_FREE_VALUES)
+                         for i in range(256)], dtype=np.float32)
+
+
+def length_norm(length):
+    """one byte norm of a field with 'length' words"""
+    if length < NORM_FREE_VALUES:
+        return length
+    return NORM_FREE_VALUES + long_to_int4(length - NORM_FREE_VALUES)
+
+
+def encode_varints(values):
+    """uint8 array of unsigned LEB128 varints for the non-negative int64 array 'values'"""
+    values = values.astype(np.uint64)
+    lengths = np.ones(len(values), dtype=np.int64)
+    for k in range(1, 10):
+        lengths += values >= np.uint64(1 << (7 * k))
+    positions = np.cumsum(lengths) - lengths
+    encoded = np.empty(int(lengths.sum()), dtype=np.uint8)
+    for k in range(int(lengths.max(initial=1))):
+        present = lengths > k
+        byte = (values[present] >> np.uint64(7 * k)) & np.uint64(0x7F)
+        byte |= np.where(lengths[present] > k + 1, np.uint64(0x80), np.uint64(0))
+        encoded[positions[present] + k] = byte
+    return encoded, lengths
+
+
+def decode_varints(encoded):
+    """int64 array of the values of uint8 array 'encoded', from encode_varints"""
+    ends = encoded < 0x80
+    starts = np.flatnonzero(np.concatenate(([True], ends[:-1])))
+    shifts = (np.arange(len(encoded)) - np.repeat(starts, np.diff(np.append(starts, len(encoded))))) * 7
+    return np.bitwise_or.reduceat((encoded & 0x7F).astype(np.int64) << shifts, starts) if len(encoded) else np.empty(0, np.int64)
+
+
+def processed_segments(file):
+    """Yields (species, chromosome, dsSO, dsEO, fsSO, fsEO, data) for each line of .processed 'file', data as bytes"""
+    with open(file, "rb") as inFile:
+        for line in inFile:
+            fields = line.rstrip(b"\n").split(b" ", 6)
+            if len(fields) < 6:
+                continue
+            species, chromosome = fields[0].decode(), fields[1].decode()
+            yield (species, chromosome, *map(int, fields[2:6]), fields[6] if len(fields) == 7 else b"")
+
+
+def segment_hashes(file):
+    """Yields (species, chromosome, dsSO, dsEO, fsSO, fsEO, hashes) for each segment of a .processed or .hashed.processed 'file'"""
+    if file.endswith(".hashed.processed"):
+        for header, fields, hashes in hashed_records(file, HASHED_SEGMENT):
+            yield (header["species"], header["chromosome"], *fields[:4], hashes)
+    else:
+        for *segment, data in processed_segments(file):
+            yield (*segment, word_hashes(data))
+
+
+def read_hashed_samples(file):
+    """Yields the same samples as sample_query.read_samples from a .hashed.samples 'file', with word hashes instead of text"""
+    for header, (dsSO, dsEO, fsSO, fsEO, orientation, textLength, numberWords), hashes in hashed_records(file, HASHED_SAMPLE):
+        location = f"{header['species']} {header['chromosome']} {dsSO} {dsEO} {fsSO} {fsEO}"
+        # the same short samples as in the text file are skipped
+        if len(location) + len(ORIENTATIONS[orientation]) + textLength + 3 > 100:
+            yield header["species"], header["chromosome"], str(fsSO), ORIENTATIONS[orientation], hashes
+
+
+def query_hashes(data):
+    """word hashes of sample 'data', text or word hashes from read_hashed_samples"""
+    return data if isinstance(data, np.ndarray) else word_hashes(data.encode())
+
+
+def write_array(folder, name, array):
+    np.save(f"{folder}/{name}.tmp.npy", array)
+    os.replace(f"{folder}/{name}.tmp.npy", f"{folder}/{name}")
+
+
+def build_index(files, folder):
+    """Writes the index of the segments in .processed 'files' to 'folder', returns the number of segments"""
+    os.makedirs(folder, exist_ok=True)
+    if os.path.exists(f"{folder}/index.json"):
+        os.remove(f"{folder}/index.json")
+    names = {"species": {}, "chromosomes": {}}
+    segments = []
+    terms = []
+    documents = []
+    frequencies = []
+    totalWords = 0
+    for file in files:
+        for species, chromosome, dsSO, dsEO, fsSO, fsEO, hashes in segment_hashes(file):
+            segmentTerms, counts = np.unique(hashes, return_counts=True)
+            terms.append(segmentTerms)
+            frequencies.append(counts)
+            documents.append(np.full(len(segmentTerms), len(segments), dtype=np.int64))
+            totalWords += len(hashes)
+            segments.append((names["species"].setdefault(species, len(names["species"])),
+                             names["chromosomes"].setdefault(chromosome, len(names["chromosomes"])),
+                             dsSO, dsEO, fsSO, fsEO, length_norm(len(hashes))))
+
+    terms = np.concatenate(terms) if terms else np.empty(0, dtype=np.uint64)
+    documents = np.concatenate(documents) if documents else np.empty(0, dtype=np.int64)
+    frequencies = np.concatenate(frequencies) if frequencies else np.empty(0, dtype=np.int64)
+    order = np.lexsort((documents, terms))
+    terms, documents, frequencies = terms[order], documents[order], frequencies[order]
+    uniqueTerms, termStarts, docFreqs = np.unique(terms, return_index=True, return_counts=True)
+
+    deltas = documents.copy()
+    deltas[1:] -= documents[:-1]
+    deltas[termStarts] = documents[termStarts]
+    pairs = np.empty(2 * len(deltas), dtype=np.int64)
+    pairs[0::2] = deltas
+    pairs[1::2] = frequencies
+    encoded, lengths = encode_varints(pairs)
+    byteOffsets = np.concatenate(([0], np.cumsum(lengths)))
+    postingsOffsets = np.append(byteOffsets[2 * termStarts], len(encoded)).astype(np.int64)
+
+    with open(f"{folder}/postings.bin.tmp", "wb") as outFile:
+        outFile.write(encoded.tobytes())
+    os.replace(f"{folder}/postings.bin.tmp", f"{folder}/postings.bin")
+    write_array(folder, "terms.npy", uniqueTerms)
+    write_array(folder, "postings_offsets.npy", postingsOffsets)
+    write_array(folder, "doc_freqs.npy", docFreqs.astype(np.uint32))
+    write_array(folder, "segments.npy", np.array(segments, dtype=SEGMENT_FIELDS))
+    with open(f"{folder}/index.json.tmp", "w") as outFile:
+        json.dump({"species": list(names["species"]), "chromosomes": list(names["chromosomes"]),
+                   "segments": len(segments), "words": totalWords, "files": list(files)}, outFile)
+    os.replace(f"{folder}/index.json.tmp", f"{folder}/index.json")
+    return len(segments)
+
+
+class LocalIndex:
+    """Searches an index written by build_index, the 'search' results are shaped like Elasticsearch search responses"""
+    def __init__(self, folder):
+        with open(f"{folder}/index.json") as inFile:
+            info = json.load(inFile)
+        self.name = os.path.basename(os.path.normpath(folder))
+        self.species = info["species"]
+        self.chromosomes = info["chromosomes"]
+        self.numberSegments = info["segments"]
+        self.terms = np.load(f"{folder}/terms.npy", mmap_mode="r")
+        self.postingsOffsets = np.load(f"{folder}/postings_offsets.npy", mmap_mode="r")
+        self.docFreqs = np.load(f"{folder}/doc_freqs.npy", mmap_mode="r")
+        self.segments = np.load(f"{folder}/segments.npy", mmap_mode="r")
+        self.postings = np.memmap(f"{folder}/postings.bin", dtype=np.uint8, mode="r") if self.postingsOffsets[-1] else np.empty(0, np.uint8)
+        self.norms = np.asarray(self.segments["norm"])
+        averageLength = np.float32(info["words"] / max(self.numberSegments, 1))
+        # 1 / (k1 * (1 - b + b * dl / avgdl)) for each norm, as in Lucene's BM25Scorer
+        self.normInverses = np.float32(1) / (BM25_K1 * ((np.float32(1) - BM25_B) + BM25_B * NORM_LENGTHS / averageLength))
+
+    def postings_of(self, termIndexes):
+        """Returns (documents, frequencies, numberPostings) of the words at 'termIndexes'"""
+        starts = self.postingsOffsets[termIndexes]
+        lengths = self.postingsOffsets[termIndexes + 1] - starts
+        positions = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths) + np.arange(lengths.sum())
+        pairs = decode_varints(np.asarray(self.postings[positions]))
+        numberPostings = self.docFreqs[termIndexes].astype(np.int64)
+        deltas = pairs[0::2]
+        sums = np.cumsum(deltas)
+        # segment numbers are the sums of the deltas within the postings of each word
+        firsts = np.cumsum(numberPostings) - numberPostings
+        return sums - np.repeat(sums[firsts] - deltas[firsts], numberPostings), pairs[1::2], numberPostings
+
+    def scores(self, data):
+        """float32 BM25 score of every segment for a match query with the words of 'data'"""
+        queryTerms, boosts = np.unique(query_hashes(data), return_counts=True)
+        termIndexes = np.searchsorted(self.terms, queryTerms)
+        found = termIndexes < len(self.terms)
+        found[found] = self.terms[termIndexes[found]] == queryTerms[found]
+        termIndexes, boosts = termIndexes[found], boosts[found]
+        if not len(termIndexes):
+            return np.zeros(self.numberSegments, dtype=np.float32)
+        documents, frequencies, numberPostings = self.postings_of(termIndexes)
+        docFreqs = numberPostings.astype(np.float64)
+        idf = np.log(1 + (self.numberSegments - docFreqs + 0.5) / (docFreqs + 0.5)).astype(np.float32)
+        # a word repeated in the query is one clause with its count as boost
+        weights = np.repeat(boosts.astype(np.float32) * BM25_BOOST * idf, numberPostings)
+        termScores = weights - weights / (np.float32(1) + frequencies.astype(np.float32) * self.normInverses[self.norms[documents]])
+        # clause scores are summed as doubles, then the sum is a float
+        return np.bincount(documents, weights=termScores.astype(np.float64), minlength=self.numberSegments).astype(np.float32)
+
+    def search(self, data, size=SEARCH_SIZE):
+        """Elasticsearch style search response with the top 'size' segments for a match query with the words of 'data'"""
+        scores = self.scores(data)
+        matches = np.flatnonzero(scores > 0)
+        # highest scores first, equal scores in index order
+        top = matches[np.lexsort((matches, -scores[matches]))][:size]
+        hits = []
+        for i in top:
+            segment = self.segments[i]
+            source = {"sp": self.species[segment["sp"]], "chr": self.chromosomes[segment["chr"]],
+                      "dSO": int(segment["dSO"]), "dEO": int(segment["dEO"]), "segloc": int(segment["segloc"]), "sEO": int(segment["sEO"])}
+            hits.append({"_index": self.name, "_id": f"{source['sp']}.{source['chr']}.{source['segloc']}",
+                         "_score": float(scores[i]), "_source": source})
+        return {"hits": {"total": {"value": len(matches), "relation": "eq"},
+                         "max_score": hits[0]["_score"] if hits else None, "hits": hits}}
+
+
+@click.command()
+@click.option("--folder", prompt="index folder", help="folder to write the index files to")
+@click.argument("files", nargs=-1)
+def build(folder, files):
+    files = expand_files(files)
+    start = time.perf_counter()
+    numberSegments = build_index(files, folder)
+    size = sum(os.path.getsize(f"{folder}/{name}") for name in INDEX_FILES)
+    print(f"indexed {numberSegments} segments of {len(files)} files in {time.perf_counter() - start:.1f} seconds, "
+          f"{math.ceil(size / 1024 / 1024)}MB in {folder}")
+
+
+if __name__ == "__main__":
+    build()
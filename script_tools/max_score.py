@@ -33,41 +33,110 @@ in original unprocessed text data file.
 This program takes processes the CSV search results, keeping only the maximum score record for
 each matching species.
 
-For each CSV file in the source folder, if there is NOT a corresponding CSV file in the dest folder,
+For each CSV file in the source folder, if there is NOT a corresponding CSV file in the dest folder for it (see below),
 the CSV file is read, a new DataFrame is created containing only the species matches with maximum scores,
 and the new result is saved in a CSV file with the same name in the "max_csv_folder"
+
+.parquet and .arrow results files (see results_store.py) in the source folder are processed too, and with
+--format parquet or arrow the results are saved in that format, "X.samples.csv" as "X.samples.parquet".
+
+Files are read in chunks of --chunkrows rows, only the rows with the maximum score so far for each
+(sp, chr, loc, msp) are kept between chunks, so memory does not grow with the number of rows of a file (see
+max_score_rows).  Output rows are the same as keeping every row with the maximum score of its (loc, msp), in
+the order they are in the file.  With --stream_to the rows are read from standard input, as sample_query.py
+prints them, e.g.
+
+python sample_query.py --query X.samples --index alltest | python max_score.py --stream_to X.samples.csv
+
+Output files are written to a temporary file and renamed, with a .manifest file recording the size and
+modification time of the input.  An output is processed again when it has no manifest or the input changed.
+Files are processed in parallel, by --workers processes.
 """
 import click
 import glob, os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
 import pandas as pd
 
+from processing import file_info, read_json, write_json
+from results_store import CHUNK_ROWS, empty_results, read_results_chunks, results_frame, write_results
+
+RESULT_EXTENSIONS = [".csv", ".parquet", ".arrow"]
+MAX_SCORE_KEY = ['sp', 'chr', 'loc', 'msp']
+
+
+def max_score_rows(chunks):
+    """DataFrame of the rows of 'chunks' with the maximum score of their (sp, chr, loc, msp), in row order.
+
+    Rows tied with the maximum are all kept, the rows kept between chunks are the best for each key so far.
+    """
+    best = empty_results()
+    for chunk in chunks:
+        rows = results_frame(pd.concat([best, chunk])) if len(best) else chunk
+        isMax = rows.groupby(MAX_SCORE_KEY, observed=True, sort=False)['score'].transform("max") == rows['score']
+        best = rows[isMax]
+    return best.sort_index()
+
+
+def write_max_scores(df, out_file):
+    """writes max score rows 'df' to 'out_file', a CSV file with a header and the row numbers, or in the format of its extension"""
+    if out_file.endswith(".csv"):
+        df.to_csv(f"{out_file}.tmp")
+        os.replace(f"{out_file}.tmp", out_file)
+    else:
+        write_results(df, out_file)
+
+
+def process_file(in_file, out_file, chunkRows=CHUNK_ROWS):
+    """writes the max score rows of results 'in_file' to 'out_file', with a manifest for the input, returns the number of rows"""
+    info = file_info(in_file)
+    df = max_score_rows(read_results_chunks(in_file, chunkRows))
+    write_max_scores(df, out_file)
+    write_json(f"{out_file}.manifest", {"input": os.path.abspath(in_file), **info})
+    return len(df)
+
+
+def is_current(in_file, out_file):
+    """True if 'out_file' was written for the current contents of 'in_file'"""
+    manifest = read_json(f"{out_file}.manifest")
+    return os.path.exists(out_file) and manifest is not None and \
+        {"size": manifest.get("size"), "mtime": manifest.get("mtime")} == file_info(in_file)
+
 
 @click.command()
 @click.option("--csv_folder",
               help="folder containing CSV files, each line:  sp,chr,loc,score,msp,mchr,mloc,orientation,segsize,dsSO")
 @click.option("--max_csv_folder", help="folder containing CSV files with only max match to another species")
-def process_csv_files(csv_folder, max_csv_folder):
-    os.chdir(csv_folder)
-    csv_files_to_process = glob.glob("*.csv")
+@click.option("--format", "resultsFormat", type=click.Choice(["csv", "parquet", "arrow"]), default="csv",
+              help="format of the files written to max_csv_folder")
+@click.option("--workers", type=int, help="number of worker processes, defaults to the number of CPUs")
+@click.option("--chunkrows", type=int, default=CHUNK_ROWS, help="number of rows read at a time")
+@click.option("--stream_to", help="read result rows from standard input and write the max score rows to this file")
+def process_csv_files(csv_folder, max_csv_folder, resultsFormat, workers, chunkrows, stream_to):
+    if stream_to is not None:
+        write_max_scores(max_score_rows(read_results_chunks(sys.stdin, chunkrows)), stream_to)
+        return
+    csv_files_to_process = sorted(os.path.basename(file) for extension in RESULT_EXTENSIONS
+                                  for file in glob.glob(os.path.join(csv_folder, f"*{extension}")))
     if not os.path.exists(max_csv_folder):
         print(f"PATH {max_csv_folder} does not exist, CREATING IT")
         os.mkdir(max_csv_folder)
-    os.chdir(max_csv_folder)
-    csv_files_already_processed = glob.glob("*.csv")
-
-    def process_csv_file(in_file, out_file):
-        df = pd.read_csv(in_file,
-                         names=['sp', 'chr', 'loc', 'score', 'msp', 'mchr', 'mloc', 'orientation', 'segsize', 'dsSO', 'dsEO'],
-                         index_col=False)
-        idx = df.groupby(['loc', 'msp'])['score'].transform(max) == df['score']
-        df[idx].to_csv(out_file)
 
+    # one input for each output, a CSV file is used before a Parquet or Arrow file of the same name
+    outputs = {}
     for file in csv_files_to_process:
-        if file not in csv_files_already_processed:
-            print(f"Processing: {file}")
-            process_csv_file(os.path.join(csv_folder, file), os.path.join(max_csv_folder, file))
-        else:
-            print(f"..already processed: {file}")
+        outputs.setdefault(f"{os.path.splitext(file)[0]}.{resultsFormat}", file)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for out_name, file in outputs.items():
+            in_file, out_file = os.path.join(csv_folder, file), os.path.join(max_csv_folder, out_name)
+            if is_current(in_file, out_file):
+                print(f"..already processed: {file}")
+            else:
+                futures[executor.submit(process_file, in_file, out_file, chunkrows)] = file
+        for future in as_completed(futures):
+            print(f"Processed: {futures[future]}, {future.result()} max score rows")
 
 
 if __name__ == "__main__":
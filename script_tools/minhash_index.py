@@ -0,0 +1,138 @@
+"""
+Example: python minhash_index.py --folder /genomes/alltest/minhash_index "/genomes/alltest/processed/*.processed"
+
+MinHash sketch index of .processed segments, an approximate alternative to BM25 searches:
+
+python async_sample_query.py --backend minhash --index /genomes/alltest/minhash_index "/genomes/alltest/samples/*.samples"
+
+Each segment is kept as a bottom-k MinHash sketch, the SKETCH_SIZE smallest hashes of its set of words (hashed
+as in local_index.py), so the index has a fixed size per segment however long the segments are.  Sketch hashes
+are the LSH buckets:  segments sharing a hash with a sample are the candidate matches.
+
+A sample is a small part of a segment, so their Jaccard similarity is low even for the segment it came from,
+instead the score estimates containment, the fraction of the sample's words in the segment.  Only sample words
+with a hash at most the segment's largest sketch hash can be in its sketch, the estimate is the fraction of those
+that are.  The score in the CSV rows is the containment times 1000, the top 10 segments are returned.
+
+Index files in 'folder':
+
+- bucket_hashes.npy, bucket_segments.npy, the sketch hashes of all segments sorted, with their segment numbers
+- thresholds.npy, the largest sketch hash of each segment, or the largest hash value when all its words are in the sketch
+- segments.npy, index.json, as in local_index.py
+"""
+import click
+import json
+import math
+import os
+import time
+
+import numpy as np
+
+from file_patterns import expand_files
+from local_index import SEARCH_SIZE, SEGMENT_FIELDS, query_hashes, segment_hashes, write_array
+
+SKETCH_SIZE = 1024
+SCORE_SCALE = 1000
+INDEX_FILES = ["bucket_hashes.npy", "bucket_segments.npy", "thresholds.npy", "segments.npy"]
+ALL_HASHES = np.iinfo(np.uint64).max
+
+
+def bottom_sketch(hashes, size=SKETCH_SIZE):
+    """Returns (sketch, threshold), the 'size' smallest distinct 'hashes' and the largest hash the sketch covers"""
+    distinct = np.unique(hashes)
+    if len(distinct) <= size:
+        return distinct, ALL_HASHES
+    return distinct[:size], distinct[size - 1]
+
+
+def build_index(files, folder, size=SKETCH_SIZE):
+    """Writes the sketch index of the segments in .processed 'files' to 'folder', returns the number of segments"""
+    os.makedirs(folder, exist_ok=True)
+    if os.path.exists(f"{folder}/index.json"):
+        os.remove(f"{folder}/index.json")
+    names = {"species": {}, "chromosomes": {}}
+    segments = []
+    sketches = []
+    thresholds = []
+    for file in files:
+        for species, chromosome, dsSO, dsEO, fsSO, fsEO, hashes in segment_hashes(file):
+            sketch, threshold = bottom_sketch(hashes, size)
+            sketches.append(sketch)
+            thresholds.append(threshold)
+            segments.append((names["species"].setdefault(species, len(names["species"])),
+                             names["chromosomes"].setdefault(chromosome, len(names["chromosomes"])),
+                             dsSO, dsEO, fsSO, fsEO, 0))
+
+    bucketHashes = np.concatenate(sketches) if sketches else np.empty(0, dtype=np.uint64)
+    bucketSegments = np.repeat(np.arange(len(sketches), dtype=np.uint32), [len(sketch) for sketch in sketches])
+    order = np.argsort(bucketHashes, kind="stable")
+    write_array(folder, "bucket_hashes.npy", bucketHashes[order])
+    write_array(folder, "bucket_segments.npy", bucketSegments[order])
+    write_array(folder, "thresholds.npy", np.array(thresholds, dtype=np.uint64))
+    write_array(folder, "segments.npy", np.array(segments, dtype=SEGMENT_FIELDS))
+    with open(f"{folder}/index.json.tmp", "w") as outFile:
+        json.dump({"species": list(names["species"]), "chromosomes": list(names["chromosomes"]),
+                   "segments": len(segments), "sketch_size": size, "files": list(files)}, outFile)
+    os.replace(f"{folder}/index.json.tmp", f"{folder}/index.json")
+    return len(segments)
+
+
+class MinHashIndex:
+    """Searches an index written by build_index, the 'search' results are shaped like Elasticsearch search responses"""
+    def __init__(self, folder):
+        with open(f"{folder}/index.json") as inFile:
+            info = json.load(inFile)
+        self.name = os.path.basename(os.path.normpath(folder))
+        self.species = info["species"]
+        self.chromosomes = info["chromosomes"]
+        self.numberSegments = info["segments"]
+        self.bucketHashes = np.load(f"{folder}/bucket_hashes.npy", mmap_mode="r")
+        self.bucketSegments = np.load(f"{folder}/bucket_segments.npy", mmap_mode="r")
+        self.thresholds = np.load(f"{folder}/thresholds.npy")
+        self.segments = np.load(f"{folder}/segments.npy", mmap_mode="r")
+
+    def containments(self, data):
+        """Returns (segments, containment) for the segments with a sketch hash of the words of 'data'"""
+        sampleHashes = np.unique(query_hashes(data))
+        starts = np.searchsorted(self.bucketHashes, sampleHashes, side="left")
+        ends = np.searchsorted(self.bucketHashes, sampleHashes, side="right")
+        lengths = ends - starts
+        positions = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths) + np.arange(lengths.sum())
+        shared = np.bincount(self.bucketSegments[positions], minlength=self.numberSegments)
+        candidates = np.flatnonzero(shared)
+        # sample words that would be in the sketch of each candidate, if they were in the segment
+        covered = np.searchsorted(sampleHashes, self.thresholds[candidates], side="right")
+        return candidates, shared[candidates] / covered
+
+    def search(self, data, size=SEARCH_SIZE):
+        """Elasticsearch style search response with the top 'size' segments by containment of the words of 'data'"""
+        candidates, containment = self.containments(data)
+        scores = (containment * SCORE_SCALE).astype(np.float32)
+        # highest scores first, equal scores in index order
+        top = np.lexsort((candidates, -scores))[:size]
+        hits = []
+        for i, score in zip(candidates[top], scores[top]):
+            segment = self.segments[i]
+            source = {"sp": self.species[segment["sp"]], "chr": self.chromosomes[segment["chr"]],
+                      "dSO": int(segment["dSO"]), "dEO": int(segment["dEO"]), "segloc": int(segment["segloc"]), "sEO": int(segment["sEO"])}
+            hits.append({"_index": self.name, "_id": f"{source['sp']}.{source['chr']}.{source['segloc']}",
+                         "_score": float(score), "_source": source})
+        return {"hits": {"total": {"value": len(candidates), "relation": "eq"},
+                         "max_score": hits[0]["_score"] if hits else None, "hits": hits}}
+
+
+@click.command()
+@click.option("--folder", prompt="index folder", help="folder to write the index files to")
+@click.option("--sketchsize", type=int, default=SKETCH_SIZE, help="number of hashes kept for each segment")
+@click.argument("files", nargs=-1)
+def build(folder, sketchsize, files):
+    files = expand_files(files)
+    start = time.perf_counter()
+    numberSegments = build_index(files, folder, sketchsize)
+    size = sum(os.path.getsize(f"{folder}/{name}") for name in INDEX_FILES)
+    print(f"indexed {numberSegments} segments of {len(files)} files in {time.perf_counter() - start:.1f} seconds, "
+          f"{math.ceil(size / 1024 / 1024)}MB in {folder}")
+
+
+if __name__ == "__main__":
+    build()
@@ -0,0 +1,88 @@
+"""
+Example: python parallel_processing.py --files ../experiments/configurations/3_primate_test/3_primate_test.txt --segsize 50k --wordlen 14 --targetfolder /tmp/3_primate_test --samplesizepercent 2 --numbersamples 3 --minwords 20000
+
+Runs processing.py for every chromosome file in the input data specification, using a pool of worker processes.
+
+The input data specification has one line per chromosome file:  <species> <chromosome> <filePath>
+
+The output is the same as running processing.py for each line in turn, in 'targetfolder':
+
+processed/<species>.<chromosome>.<segsize>.<wordlen>.processed
+samples/<species>.<chromosome>.<segsize>.<wordlen>.samples
+
+With --bulk, also processed/<species>.<chromosome>.<segsize>.<wordlen>.bulk.ndjson, loaded as it is by
+bulk_load.py, and with --compression the files have a .gz or .zst extension.  With --hashed the words are written
+as 64 bit hashes to binary .hashed.processed and .hashed.samples files instead, for the local and minhash search
+backends.
+
+Files already processed with the same parameters are skipped, and interrupted files resume from their
+last checkpoint (see processing.process_file).
+
+Largest files are started first, so a large chromosome does not start last and keep the other workers waiting.
+With --segmentworkers each file is also split into ranges of segments processed in parallel (see processing.prepare_for_es).
+"""
+import click
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from processing import process_file, convert_str_to_number
+
+
+def read_input_data_specification(files):
+    """Returns a list of (species, chromosome, filePath) for each line of 'files'"""
+    with open(files) as inFile:
+        return [tuple(line.strip().split()) for line in inFile if line.strip()]
+
+
+def timed_process_file(*args, **kwargs):
+    """process_file, returning its result and the elapsed seconds"""
+    start = time.perf_counter()
+    processed = process_file(*args, **kwargs)
+    return processed, time.perf_counter() - start
+
+
+@click.command()
+@click.option("--files",
+              help="text file with list of files to processes, each line with <species> <chromosome> <filePath>")
+@click.option("--segsize", help="segment size, e.g. 50k or 1M")
+@click.option("--wordlen", help="minimum word length", type=int)
+@click.option("--targetfolder", help="folder containing the 'processed' and 'samples' folders")
+@click.option("--samplesizepercent", help="percent of segment to use as a sample", type=int)
+@click.option("--numbersamples", type=int,
+              help="number of samples to generate, doubled because reverse complement samples also generated")
+@click.option("--minwords", help="minimum number of words in a segment", type=int)
+@click.option("--ndel", help="number of random subsequences to delete", type=int, default=0)
+@click.option("--ndellen", help="length of each random subsequence to delete", type=int, default=0)
+@click.option("--workers", help="number of worker processes, defaults to the number of CPUs", type=int)
+@click.option("--segmentworkers", type=int, default=1,
+              help="number of worker processes for ranges of segments in each file, for a few very large files")
+@click.option("--compression", type=click.Choice(["gzip", "zstd"]), help="compress the output files")
+@click.option("--bulk/--no-bulk", default=False, help="also write Elasticsearch _bulk NDJSON files")
+@click.option("--hashed/--no-hashed", default=False, help="write words as 64 bit hashes in binary files, for the local search backends")
+def process_files(files, segsize, wordlen, targetfolder, samplesizepercent, numbersamples, minwords, ndel, ndellen, workers, segmentworkers,
+                  compression, bulk, hashed):
+    segmentSize = convert_str_to_number(segsize)
+    os.makedirs(f"{targetfolder}/processed", exist_ok=True)
+    os.makedirs(f"{targetfolder}/samples", exist_ok=True)
+    input_data = sorted(read_input_data_specification(files), key=lambda line: os.path.getsize(line[2]), reverse=True)
+
+    start = time.perf_counter()
+    total = len(input_data)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(timed_process_file, species, chromosome, filePath, segmentSize, wordlen, targetfolder,
+                                   samplesizepercent, numbersamples, minwords, ndel, ndellen, segmentworkers,
+                                   compression=compression, bulk=bulk, hashed=hashed): (species, chromosome, filePath)
+                   for species, chromosome, filePath in input_data}
+        for counter, future in enumerate(as_completed(futures), 1):
+            species, chromosome, filePath = futures[future]
+            processed, seconds = future.result()
+            if processed:
+                print(f"processed file {filePath} ({counter} of {total}), {species} {chromosome} in {seconds:.1f} seconds")
+            else:
+                print(f"SKIPPING file {filePath} ({counter} of {total}), {species} {chromosome} already processed")
+    print(f"processed {total} files in {time.perf_counter() - start:.1f} seconds")
+
+
+if __name__ == '__main__':
+    process_files()
@@ -1,5 +1,23 @@
 import gzip
+import hashlib
+import io
+import json
+import mmap
+import os
 import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from gzip_blocks import open_gzip
+from hashed_words import HASHED_SAMPLE, HASHED_SEGMENT, ORIENTATIONS, word_hashes, write_hashed_header
+from reverse_complement import revcomp
 
 """
 These are generators for processing a long sequence data source.
@@ -38,7 +56,7 @@ class DataSourceFilter:
     def open_datasource(self, datasource):
         ext = datasource.split(".")[-1]
         if ext == "gz":
-            return gzip.open(datasource, "rt")
+            return io.TextIOWrapper(open_gzip(datasource))
         else:
             return open(datasource, "r")
 
@@ -52,6 +70,146 @@ class DataSourceFilter:
                 dataOffset += len(line)
 
 
+DEFAULT_READ_BLOCK_SIZE = 256 * 1024
+
+
+def dataIndexToBlockOffset(block, dataIndex, knownDataIndex=0, knownOffset=0):
+    """Return the offset in 'block' of sequence value 'dataIndex', where only newlines separate sequence values.
+
+    'knownDataIndex' sequence values come before 'knownOffset', only the block after 'knownOffset' is scanned.
+    """
+    offset = knownOffset + dataIndex - knownDataIndex
+    newlines = knownOffset - knownDataIndex + block.count(b'\n', knownOffset, offset)
+    while dataIndex + newlines != offset:
+        nextOffset = dataIndex + newlines
+        newlines += block.count(b'\n', offset, nextOffset)
+        offset = nextOffset
+    while block[offset] == 10:
+        offset += 1
+    return offset
+
+
+def lineWidth(block, dataLength):
+    """Return the line width when all lines in 'block' have the same width, otherwise None.
+
+    A last line without a newline may be shorter.  Sequence value offsets in the block are then
+    'dataIndex + dataIndex // width'
+    """
+    width = block.find(b'\n')
+    newlines = len(block) - dataLength
+    if width > 0 and block[width::width + 1].count(b'\n') == newlines and dataLength <= (newlines + 1) * width:
+        return width
+    return None
+
+
+def commentLineBlocks(block):
+    """Split a block so that '>' comment lines are separate from the sequence data, yields (offset, block)"""
+    offset = 0
+    while offset < len(block):
+        if block.startswith(b'>', offset):
+            end = block.find(b'\n', offset) + 1
+        else:
+            end = block.find(b'>', offset)
+            while end > 0 and block[end - 1] != 10:
+                end = block.find(b'>', end + 1)
+        if end <= 0:
+            end = len(block)
+        yield offset, block[offset:end]
+        offset = end
+
+
+class ChunkedDataSourceFilter(DataSourceFilter):
+    """
+    Same output as DataSourceFilter with the default '>' comment line filter, but reads the data source
+    in large binary blocks instead of one text line at a time.
+
+    Yields (dataSourceStartOffset, dataSourceEndOffset, data)
+
+    Newlines are removed from a block, so a block is NOT contiguous in the data source:
+    'dataSourceStartOffset' is the offset of the first sequence value, 'dataSourceEndOffset' is the offset
+    just after the last one.  Blocks never cross a multiple of 'alignment' sequence values, so a
+    SegmentGenerator using the same segment size only ever splits between blocks.
+
+    Comment lines, and blocks with anything other than sequence values and newlines (e.g. '\\r'),
+    are filtered line by line.  Offsets are the same as DataSourceFilter, except for '\\r\\n' line endings:
+    DataSourceFilter counts those as one character, here all offsets are byte offsets.
+    """
+    def __init__(self, filePath, blockSize=DEFAULT_READ_BLOCK_SIZE, alignment=None, useMmap=True, startOffset=0, endOffset=None):
+        super().__init__(filePath)
+        self.blockSize = blockSize
+        self.alignment = alignment
+        self.useMmap = useMmap
+        # only read data source offsets from 'startOffset' up to 'endOffset', a sequence value must start at both
+        self.startOffset = startOffset
+        self.endOffset = endOffset
+
+    def raw_blocks(self):
+        """Yields (dataOffset, block), each block is binary data ending on a line boundary"""
+        if self.filePath.endswith(".gz") or not self.useMmap:
+            with (open_gzip(self.filePath) if self.filePath.endswith(".gz") else open(self.filePath, "rb")) as inFile:
+                dataOffset = inFile.seek(self.startOffset)
+                while self.endOffset is None or dataOffset < self.endOffset:
+                    block = inFile.read(self.blockSize if self.endOffset is None else min(self.blockSize, self.endOffset - dataOffset))
+                    if not block:
+                        break
+                    if not block.endswith(b'\n'):
+                        block += inFile.readline(-1 if self.endOffset is None else self.endOffset - dataOffset - len(block))
+                    yield dataOffset, block
+                    dataOffset += len(block)
+        else:
+            with open(self.filePath, "rb") as inFile:
+                if inFile.seek(0, 2) == 0:
+                    return
+                with mmap.mmap(inFile.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    dataOffset = self.startOffset
+                    size = len(mm) if self.endOffset is None else self.endOffset
+                    while dataOffset < size:
+                        endOffset = mm.find(b'\n', min(dataOffset + self.blockSize, size) - 1, size)
+                        endOffset = size if endOffset == -1 else endOffset + 1
+                        yield dataOffset, mm[dataOffset:endOffset]
+                        dataOffset = endOffset
+
+    def block_lines(self, dataOffset, block):
+        """Line by line filtering, same as DataSourceFilter.sequences"""
+        for line in block.splitlines(keepends=True):
+            text = line.decode()
+            if self.accept(text):
+                stripped_line = text.strip()
+                yield (dataOffset, dataOffset + len(stripped_line), stripped_line)
+            dataOffset += len(line)
+
+    def sequences(self):
+        filteredOffset = 0
+        for rawOffset, rawBlock in self.raw_blocks():
+            for blockOffset, block in commentLineBlocks(rawBlock):
+                dataOffset = rawOffset + blockOffset
+                data = block.replace(b'\n', b'')
+                if data.split(maxsplit=1) != [data] or block.startswith(b'>'):
+                    for sequence in self.block_lines(dataOffset, block):
+                        filteredOffset += len(sequence[2])
+                        yield sequence
+                    continue
+
+                data = data.decode()
+                width = lineWidth(block, len(data))
+                knownDataIndexOffset = (0, 0)
+                start = 0
+                while start < len(data):
+                    end = len(data)
+                    if self.alignment:
+                        end = min(end, start + self.alignment - (filteredOffset + start) % self.alignment)
+                    if width:
+                        startOffset = start + start // width
+                        endOffset = end - 1 + (end - 1) // width + 1
+                    else:
+                        startOffset = dataIndexToBlockOffset(block, start, *knownDataIndexOffset)
+                        endOffset = dataIndexToBlockOffset(block, end - 1, start, startOffset) + 1
+                        knownDataIndexOffset = (end - 1, endOffset - 1)
+                    yield (dataOffset + startOffset, dataOffset + endOffset, data[start:end])
+                    start = end
+                filteredOffset += len(data)
+
+
 class SegmentGenerator:
     """
     Takes in small data sequences, and yields larger sequences of a fixed size
@@ -62,40 +220,51 @@ class SegmentGenerator:
     'filteredSequenceStartOffset' and 'filteredSequenceEndOffset' refer to the offset in the entire sequence of segments yielded
     'orientation' is always True
     """
-    def __init__(self, dataSourceFilter, segmentSize):
+    def __init__(self, dataSourceFilter, segmentSize, filteredSequenceStartOffset=0):
         self.dataSourceFilter = dataSourceFilter
         self.segmentSize = segmentSize
+        self.filteredSequenceStartOffset = filteredSequenceStartOffset
 
     def segments(self):
-        filteredSequenceStartOffset = 0
+        filteredSequenceStartOffset = self.filteredSequenceStartOffset
         segmentdataSourceStartOffset = 0
         segmentdataSourceEndOffset = 0
-        segmentData = ""
+        # sequences for the current segment are joined once, when the segment is complete
+        segmentPieces = []
+        segmentLength = 0
         for sequenceStartOffset, sequenceEndOffset, data in self.dataSourceFilter.sequences():
-            if segmentData == "":
+            if not segmentPieces:
                 # first time, initialize segment
                 segmentdataSourceStartOffset = sequenceStartOffset
-                segmentData = data
-                segmentdataSourceEndOffset = sequenceEndOffset
-            else:
-                # add to segment
-                segmentData += data
-                segmentdataSourceEndOffset = sequenceEndOffset
-
-            while len(segmentData) > self.segmentSize:
-                remainingSegmentData = segmentData[self.segmentSize:]
-                segmentData = segmentData[:self.segmentSize]
+            segmentdataSourceEndOffset = sequenceEndOffset
+
+            if segmentLength + len(data) <= self.segmentSize:
+                segmentPieces.append(data)
+                segmentLength += len(data)
+                continue
+
+            dataOffset = 0
+            while segmentLength + len(data) - dataOffset > self.segmentSize:
+                splitOffset = dataOffset + self.segmentSize - segmentLength
+                segmentPieces.append(data[dataOffset:splitOffset])
+                # the sequence is contiguous in the data source, unless it is a block that starts on
+                # the segment boundary (see ChunkedDataSourceFilter), where 'splitOffset' is 0
+                splitDataSourceOffset = sequenceStartOffset + splitOffset
                 yield (segmentdataSourceStartOffset,
-                       segmentdataSourceEndOffset - len(remainingSegmentData),
+                       splitDataSourceOffset,
                        filteredSequenceStartOffset,
                        filteredSequenceStartOffset + self.segmentSize,
-                       segmentData)
-                segmentData = remainingSegmentData
-                segmentdataSourceStartOffset = segmentdataSourceEndOffset - len(segmentData)
-                segmentdataSourceEndOffset - len(remainingSegmentData)
+                       ''.join(segmentPieces))
+                segmentPieces = []
+                segmentLength = 0
+                segmentdataSourceStartOffset = splitDataSourceOffset
                 filteredSequenceStartOffset += self.segmentSize
+                dataOffset = splitOffset
 
-        yield (segmentdataSourceStartOffset, segmentdataSourceEndOffset, filteredSequenceStartOffset, filteredSequenceStartOffset + len(segmentData), segmentData)
+            segmentPieces.append(data[dataOffset:] if dataOffset else data)
+            segmentLength += len(data) - dataOffset
+
+        yield (segmentdataSourceStartOffset, segmentdataSourceEndOffset, filteredSequenceStartOffset, filteredSequenceStartOffset + segmentLength, ''.join(segmentPieces))
 
 
 AT_CG_SPLIT = {'CG': 'C G', 'GC': 'G C', 'AT': 'A T', 'TA': 'T A', 'N': ''}
@@ -107,16 +276,10 @@ def wordSplitterFactory(replaceXwithY):
         for x,y in replaceXwithY.items():
             line = line.replace(x, y)
         return line
+    replaceFunction.replaceXwithY = replaceXwithY
     return replaceFunction
 
 
-COMPLEMENT = { 'A': 'T', 'C': 'G', 'G': 'C', 'T': 'A', ' ': ' ' }
-
-
-def revcomp(s):
-    return ''.join([COMPLEMENT[v] for v in reversed(s)])
-
-
 def deleterFactory(numberSubsequences, subsequenceLength):
     """Returns a function that deletes random subsequences and their reverse complement"""
     sequencesToDelete = []
@@ -124,11 +287,16 @@ def deleterFactory(numberSubsequences, subsequenceLength):
         seqToDel = ''.join(random.choice("ACGT") for i in range(subsequenceLength))
         sequencesToDelete.append(seqToDel)
         sequencesToDelete.append(revcomp(seqToDel))
+    return sequenceDeleterFactory(sequencesToDelete)
 
+
+def sequenceDeleterFactory(sequencesToDelete):
+    """Returns a function that deletes each of 'sequencesToDelete' in turn"""
     def sequenceDeleterFunction(line):
         for s in sequencesToDelete:
             line = line.replace(s, '')
         return line
+    sequenceDeleterFunction.sequencesToDelete = sequencesToDelete
     return sequenceDeleterFunction
 
 
@@ -138,9 +306,137 @@ def wordFilterFactory(minWordLen):
         words = line.split()
         filtered_words = [ word for word in words if len(word) >= minWordLen ]
         return " ".join(filtered_words)
+    wordFilterFunction.minWordLen = minWordLen
     return wordFilterFunction
 
 
+def compiledSplit(replaceXwithY):
+    """Returns (deleteBefore, splitPairs, deleteAfter) when 'replaceXwithY' only deletes single values
+    and splits pairs of different values, with all splits done together, otherwise None"""
+    deleteBefore, splitPairs, deleteAfter = [], [], []
+    for x, y in replaceXwithY.items():
+        if len(x) == 1 and y == '':
+            (deleteAfter if splitPairs else deleteBefore).append(x)
+        elif len(x) == 2 and x[0] != x[1] and y == f"{x[0]} {x[1]}" and not deleteAfter:
+            splitPairs.append(x)
+        else:
+            return None
+    return deleteBefore, splitPairs, deleteAfter
+
+
+class WordSpanFinder:
+    """
+    NumPy version of a word splitter followed by a word filter, see wordSplitterFactory and wordFilterFactory.
+
+    Words are runs of sequence values between split pair boundaries (e.g. "C G" for AT_CG_SPLIT),
+    with single values removed (e.g. "N"), and only words of at least 'minWordLen' values kept.
+
+    The kept words are (start, end) offset arrays in the segment, so relative to filteredSequenceStartOffset.
+    The words text is the same as the word filter result.
+    """
+    def __init__(self, replaceXwithY, minWordLen):
+        split = compiledSplit(replaceXwithY)
+        if split is None:
+            raise ValueError(f"words for {replaceXwithY} can not be found with NumPy")
+        self.deleteBefore, self.splitPairs, self.deleteAfter = [np.frombuffer(''.join(x).encode(), dtype=np.uint8) for x in split]
+        # empty words are always removed by the word filter
+        self.minWordLen = max(minWordLen, 1)
+
+    def boundaries(self, values):
+        """Returns (wordStarts, wordLengths), words are split at every split pair boundary"""
+        isValue = {x: values == x for x in set(self.splitPairs)}
+        boundary = np.zeros(len(values), dtype=bool)
+        boundary[0] = True
+        for x, y in self.splitPairs.reshape(-1, 2):
+            boundary[1:] |= isValue[x][:-1] & isValue[y][1:]
+        wordStarts = np.flatnonzero(boundary)
+        return wordStarts, np.diff(wordStarts, append=len(values))
+
+    def words(self, segment):
+        """Returns (starts, ends, text) for the words kept in 'segment'.
+
+        Raises ValueError for a segment with whitespace or non-ASCII values, use the word splitter and filter for those.
+        """
+        line = segment.upper()
+        if line and (not line.isascii() or line.split(maxsplit=1) != [line]):
+            raise ValueError("segment has whitespace or non-ASCII values")
+        # a separator follows the values, so the value after any word can be looked up
+        separatedValues = np.frombuffer(f"{line} ".encode(), dtype=np.uint8)
+        positions = None
+        if len(self.deleteBefore):
+            positions = np.flatnonzero(~np.isin(separatedValues, self.deleteBefore))
+            separatedValues = separatedValues[positions]
+        values = separatedValues[:-1]
+        if len(values) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), ''
+
+        wordStarts, wordLengths = self.boundaries(values)
+        # only words long enough before removing values can be long enough after
+        keptWords = wordLengths >= self.minWordLen
+        starts = wordStarts[keptWords]
+        ends = starts + wordLengths[keptWords]
+
+        removed = np.isin(separatedValues, self.deleteAfter)
+        removed[-1] = False
+        removedIndexes = np.flatnonzero(removed)
+        if len(removedIndexes):
+            lengths = ends - starts - (np.searchsorted(removedIndexes, ends) - np.searchsorted(removedIndexes, starts))
+            keptWords = lengths >= self.minWordLen
+            starts = starts[keptWords]
+            ends = ends[keptWords]
+
+        # values of the kept words, the value after each word is replaced with a separator
+        sizes = ends - starts + 1
+        outputStarts = np.cumsum(sizes) - sizes
+        indexes = np.arange(sizes.sum()) + np.repeat(starts - outputStarts, sizes)
+        output = separatedValues[indexes]
+        output[outputStarts + sizes - 1] = ord(' ')
+        if len(removedIndexes):
+            output = output[~removed[indexes] | (output == ord(' '))]
+        text = output[:-1].tobytes().decode()
+
+        if positions is not None:
+            starts = positions[starts]
+            ends = positions[ends - 1] + 1
+        return starts, ends, text
+
+    def spans(self, segment):
+        """Returns (starts, ends) offset arrays of the words kept in 'segment'"""
+        starts, ends, text = self.words(segment)
+        return starts, ends
+
+
+def compileTransforms(deleter, wordSplitter, wordFilter):
+    """Returns a function with the same result as 'deleter', 'wordSplitter' and 'wordFilter' applied in turn.
+
+    Functions from deleterFactory, wordSplitterFactory and wordFilterFactory are combined: after the
+    deletions, words are found with a single WordSpanFinder pass over the segment, instead of replacing
+    each split pair in turn, then splitting the result into words and joining them again.
+    Any other functions are applied in turn.
+    """
+    def chainedFunction(line):
+        return wordFilter(wordSplitter(deleter(line)))
+
+    if not all(hasattr(f, a) for f, a in [(deleter, 'sequencesToDelete'), (wordSplitter, 'replaceXwithY'), (wordFilter, 'minWordLen')]):
+        return chainedFunction
+    try:
+        wordSpanFinder = WordSpanFinder(wordSplitter.replaceXwithY, wordFilter.minWordLen)
+    except ValueError:
+        return chainedFunction
+    sequencesToDelete = deleter.sequencesToDelete
+
+    def compiledFunction(line):
+        for s in sequencesToDelete:
+            line = line.replace(s, '')
+        try:
+            starts, ends, text = wordSpanFinder.words(line)
+        except ValueError:
+            return wordFilter(wordSplitter(line))
+        return text
+
+    return compiledFunction
+
+
 class SegmentProcessor:
     def __init__(self, segmentGenerator, dataProcessor, minWords=0):
         self.segmentGenerator = segmentGenerator
@@ -152,9 +448,100 @@ class SegmentProcessor:
             yield (dataSourceStartOffset, dataSourceEndOffset, filteredSequenceStartOffset, filteredSequenceEndOffset, segmentData)
 
 
-class SegmentJoiner:
-    def __init__(self, target_file, sample_writer, minimum_number_words):
+OUTPUT_BUFFER_SIZE = 4 * 1024 * 1024
+COMPRESSION_EXTENSIONS = {None: "", "gzip": ".gz", "zstd": ".zst"}
+# fastest gzip level, sequence words still compress about 3 times
+GZIP_COMPRESS_LEVEL = 1
+
+
+def open_output(filePath, mode="w", compression=None, bufferSize=OUTPUT_BUFFER_SIZE):
+    """Returns a text file with a 'bufferSize' write buffer.
+
+    'compression' is None, "gzip" or "zstd" (needs the zstandard package), see COMPRESSION_EXTENSIONS for the
+    file name extension to use.  Compressed files are written with mode "w".
+    """
+    if compression is None:
+        return open(filePath, mode, buffering=bufferSize)
+    if compression == "gzip":
+        binaryFile = gzip.GzipFile(filePath, "wb", compresslevel=GZIP_COMPRESS_LEVEL)
+    elif compression == "zstd":
+        if zstandard is None:
+            raise ValueError("zstd compression needs the zstandard package, pip install zstandard")
+        binaryFile = zstandard.open(filePath, "wb")
+    else:
+        raise ValueError(f"unknown compression '{compression}', expected one of {list(COMPRESSION_EXTENSIONS)}")
+    return io.TextIOWrapper(io.BufferedWriter(binaryFile, bufferSize))
+
+
+def bulk_entry(species, chromosome, dsSO, dsEO, fsSO, fsEO, data, segmentSize, minWordSize):
+    """Elasticsearch _bulk NDJSON index action and document for a segment.
+
+    Its _id is '<species>.<chromosome>.<segmentSize>.<minWordSize>.<segloc>', so segments processed with other
+    segment sizes or word lengths and loaded into the same index do not replace each other.
+    """
+    action = json.dumps({"index": {"_id": f"{species}.{chromosome}.{segmentSize}.{minWordSize}.{fsSO}"}})
+    document = json.dumps({"sp": species, "chr": chromosome, "dSO": dsSO, "dEO": dsEO, "segloc": fsSO, "sEO": fsEO, "data": data})
+    return f"{action}\n{document}\n"
+
+
+class SegmentWriter:
+    """
+    Writes joined segments to 'target_file', one line each (parsed by bulk_load.py):
+
+    <species> <chromosome> <dsSO> <dsEO> <fsSO> <fsEO> <words>
+
+    With a 'bulk_file' each segment is also written as an Elasticsearch _bulk NDJSON index action and document,
+    with fields sp, chr, dSO, dEO, segloc, sEO, data and an _id from the species, chromosome, 'segment_size',
+    'min_word_size' and segloc (see bulk_entry), so bulk_load.py sends it without parsing the lines again.
+    """
+    def __init__(self, target_file, bulk_file=None, segment_size=None, min_word_size=None):
+        if bulk_file is not None and (segment_size is None or min_word_size is None):
+            raise ValueError("_bulk output needs the segment size and minimum word size for the document _id")
         self.targetFile = target_file
+        self.bulkFile = bulk_file
+        self.segmentSize = segment_size
+        self.minWordSize = min_word_size
+
+    def write(self, species, chromosome, dsSO, dsEO, fsSO, fsEO, data):
+        """writes the segment, returns its location, the line up to the words"""
+        location = f"{species} {chromosome} {dsSO} {dsEO} {fsSO} {fsEO}"
+        self.targetFile.write(f"{location} {data}\n")
+        if self.bulkFile is not None:
+            self.bulkFile.write(bulk_entry(species, chromosome, dsSO, dsEO, fsSO, fsEO, data, self.segmentSize, self.minWordSize))
+        return location
+
+    def flush(self):
+        self.targetFile.flush()
+        if self.bulkFile is not None:
+            self.bulkFile.flush()
+
+
+class HashedSegmentWriter(SegmentWriter):
+    """
+    Writes joined segments to binary 'target_file' with each word as a 64 bit hash (see hashed_words.word_hashes),
+    a .hashed.processed file searched with local_index.py or minhash_index.py.  After a header line with the species
+    and chromosome, each segment is HASHED_SEGMENT (dsSO, dsEO, fsSO, fsEO, number of words) and the hashes.
+    """
+    def __init__(self, target_file, species, chromosome):
+        super().__init__(target_file)
+        if target_file.tell() == 0:
+            write_hashed_header(target_file, species, chromosome)
+
+    def write(self, species, chromosome, dsSO, dsEO, fsSO, fsEO, data):
+        """writes the segment, returns its location"""
+        hashes = word_hashes(data.encode())
+        self.targetFile.write(HASHED_SEGMENT.pack(dsSO, dsEO, fsSO, fsEO, len(hashes)) + hashes.astype("<u8").tobytes())
+        return f"{species} {chromosome} {dsSO} {dsEO} {fsSO} {fsEO}"
+
+
+class SegmentJoiner:
+    def __init__(self, species, chromosome, target_file, sample_writer, minimum_number_words, flushed=None):
+        """'target_file' is a SegmentWriter or a text file.
+        'flushed' is called with (filteredSequenceEndOffset, dataSourceEndOffset) after each joined segment is written"""
+        self.flushed = flushed
+        self.species = species
+        self.chromosome = chromosome
+        self.segmentWriter = target_file if isinstance(target_file, SegmentWriter) else SegmentWriter(target_file)
         self.sample_writer = sample_writer
         self.minimum_number_words = minimum_number_words
         self.currentSegmentData = ""
@@ -184,20 +571,93 @@ class SegmentJoiner:
             self.flush()
 
     def flush(self):
-        location = f"{species} {chromosome} {self.currentSO} {self.currentEO} {self.currentFSO} {self.currentFEO}"
-        self.targetFile.write(f"{location} {self.currentSegmentData}\n")
+        # nothing stored since the last segment, e.g. at the end of a chromosome
+        if self.currentNumberWords == 0:
+            return
+        location = self.segmentWriter.write(self.species, self.chromosome, self.currentSO, self.currentEO,
+                                            self.currentFSO, self.currentFEO, self.currentSegmentData)
         self.sample_writer.write_samples(location, self.currentSegmentData)
+        if self.flushed is not None:
+            self.flushed(self.currentFEO, self.currentEO)
         self.reset()
 
 
-def prepare_for_es(fileToProcess, targetFile, segmentSize, deleter, wordSplitter, wordFilter, sampler, minimumNumberWordsPerSegment):
-    """convert each continuous sequence into a much smaller sequence of words"""
-    dsf = DataSourceFilter(fileToProcess)
-    sg = SegmentGenerator(dsf, segmentSize)
-    d = SegmentProcessor(sg, deleter)
-    sp = SegmentProcessor(d, wordSplitter)
-    wf = SegmentProcessor(sp, wordFilter)
-    sj = SegmentJoiner(targetFile, sampler, minimumNumberWordsPerSegment)
+def segmentBoundaries(fileToProcess, segmentSize, readBlockSize=DEFAULT_READ_BLOCK_SIZE):
+    """Returns a list of (filteredSequenceStartOffset, dataSourceStartOffset) for segments after the first one,
+    when the segment starts a sequence read by ChunkedDataSourceFilter, so the data source can be split there.
+
+    Segments starting in the middle of a line read line by line (e.g. '\\r\\n' line endings) are not included.
+    """
+    boundaries = []
+    filteredOffset = 0
+    for sequenceStartOffset, sequenceEndOffset, data in ChunkedDataSourceFilter(fileToProcess, readBlockSize, alignment=segmentSize).sequences():
+        if filteredOffset and filteredOffset % segmentSize == 0:
+            boundaries.append((filteredOffset, sequenceStartOffset))
+        filteredOffset += len(data)
+    return boundaries
+
+
+def processSegmentRange(fileToProcess, segmentSize, sequencesToDelete, replaceXwithY, minWordLen, readBlockSize,
+                        filteredSequenceStartOffset, startOffset, endOffset):
+    """Returns the processed segments from data source offset 'startOffset' up to 'endOffset', see segmentBoundaries.
+
+    The functions are made here from their parameters, so this can run in another process.
+    """
+    dsf = ChunkedDataSourceFilter(fileToProcess, readBlockSize, alignment=segmentSize, startOffset=startOffset, endOffset=endOffset)
+    sg = SegmentGenerator(dsf, segmentSize, filteredSequenceStartOffset)
+    transform = compileTransforms(sequenceDeleterFactory(sequencesToDelete), wordSplitterFactory(replaceXwithY), wordFilterFactory(minWordLen))
+    segments = list(SegmentProcessor(sg, transform).segments())
+    if endOffset is not None:
+        # the same as when the next segment is read, the last segment ends where the next one starts
+        segments[-1] = (segments[-1][0], endOffset) + segments[-1][2:]
+    return segments
+
+
+def parallelSegments(executor, numberRanges, fileToProcess, segmentSize, deleter, wordSplitter, wordFilter, readBlockSize,
+                     startOffsets=(0, 0)):
+    """Yields the same processed segments as SegmentProcessor, with about 'numberRanges' segment ranges processed by 'executor'"""
+    boundaries = [boundary for boundary in segmentBoundaries(fileToProcess, segmentSize, readBlockSize) if boundary[0] > startOffsets[0]]
+    step = max(len(boundaries) // numberRanges, 1)
+    starts = [startOffsets] + boundaries[step - 1::step]
+    ends = [dataSourceStartOffset for filteredOffset, dataSourceStartOffset in starts[1:]] + [None]
+    ranges = [executor.submit(processSegmentRange, fileToProcess, segmentSize,
+                              deleter.sequencesToDelete, wordSplitter.replaceXwithY, wordFilter.minWordLen, readBlockSize,
+                              filteredSequenceStartOffset, startOffset, endOffset)
+              for (filteredSequenceStartOffset, startOffset), endOffset in zip(starts, ends)]
+    for segments in ranges:
+        yield from segments.result()
+
+
+def prepare_for_es(species, chromosome, fileToProcess, targetFile, segmentSize, deleter, wordSplitter, wordFilter, sampler, minimumNumberWordsPerSegment,
+                   readBlockSize=DEFAULT_READ_BLOCK_SIZE, workers=1, startOffsets=(0, 0), flushed=None):
+    """convert each continuous sequence into a much smaller sequence of words
+
+    'readBlockSize' of 0 reads the data source line by line, otherwise in blocks of about that many bytes
+
+    'workers' more than 1 processes ranges of segments in that many processes, when reading blocks of an
+    uncompressed data source with functions from deleterFactory, wordSplitterFactory and wordFilterFactory.
+    Segments are joined in order, so the output is the same.
+
+    'startOffsets' (filteredSequenceStartOffset, dataSourceStartOffset) from segmentBoundaries starts part way
+    through the data source, when reading blocks.  'flushed' is passed to SegmentJoiner.
+    """
+    sj = SegmentJoiner(species, chromosome, targetFile, sampler, minimumNumberWordsPerSegment, flushed)
+    if workers > 1 and readBlockSize and not fileToProcess.endswith(".gz") and \
+            all(hasattr(f, a) for f, a in [(deleter, 'sequencesToDelete'), (wordSplitter, 'replaceXwithY'), (wordFilter, 'minWordLen')]):
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for segment in parallelSegments(executor, workers * 4, fileToProcess, segmentSize, deleter, wordSplitter, wordFilter, readBlockSize,
+                                            startOffsets):
+                sj.store(*segment)
+        sj.flush()
+        return
+
+    filteredSequenceStartOffset, dataSourceStartOffset = startOffsets
+    if readBlockSize:
+        dsf = ChunkedDataSourceFilter(fileToProcess, readBlockSize, alignment=segmentSize, startOffset=dataSourceStartOffset)
+    else:
+        dsf = DataSourceFilter(fileToProcess)
+    sg = SegmentGenerator(dsf, segmentSize, filteredSequenceStartOffset)
+    wf = SegmentProcessor(sg, compileTransforms(deleter, wordSplitter, wordFilter))
     for startDataOffset, endDataOffset, filteredSequenceStartOffset, filteredSequenceEndOffset, segmentData in wf.segments():
         sj.store(startDataOffset, endDataOffset, filteredSequenceStartOffset, filteredSequenceEndOffset, segmentData)
     sj.flush()
@@ -209,18 +669,51 @@ class Sampler:
         self.sample_size_percent = sample_size_percent
         self.number_samples = number_samples
 
-    def write_samples(self, location, segment_data):
-        words = segment_data.split()
-        words_per_sample = int(len(words)*self.sample_size_percent/100)
-        words_between = int((len(words) - words_per_sample*self.number_samples)/self.number_samples)
+    def samples(self, segment_data):
+        """Returns a list of (orientation, data) for the samples of 'segment_data', each followed by its reverse complement"""
+        if segment_data.startswith(' ') or segment_data.endswith(' ') or '  ' in segment_data:
+            segment_data = ' '.join(segment_data.split())
+        # words are separated by single spaces, samples are sliced from the segment data
+        separators = np.flatnonzero(np.frombuffer(segment_data.encode(), dtype=np.uint8) == ord(' '))
+        number_words = len(separators) + 1 if segment_data else 0
+        word_starts = np.append(0, separators + 1)
+        word_ends = np.append(separators, len(segment_data))
+        words_per_sample = int(number_words*self.sample_size_percent/100)
+        words_between = int((number_words - words_per_sample*self.number_samples)/self.number_samples)
         left = int(words_between/2)
+        samples = []
         for i in range(self.number_samples):
             start = left + i * (words_between + words_per_sample)
-            data = ' '.join(words[start:(start + words_per_sample)])
-            orientation = "same"
-            self.output_file.write(f"{location} {orientation} {data}\n")
-            orientation = "reversed"
-            self.output_file.write(f"{location} {orientation} {revcomp(data)}\n")
+            if words_per_sample == 0:
+                data = ''
+            elif 0 <= start and start + words_per_sample <= number_words:
+                data = segment_data[word_starts[start]:word_ends[start + words_per_sample - 1]]
+            else:
+                data = ' '.join(segment_data.split()[start:(start + words_per_sample)])
+            samples.append(("same", data))
+            samples.append(("reversed", revcomp(data)))
+        return samples
+
+    def write_samples(self, location, segment_data):
+        # all samples of the segment are written together
+        self.output_file.write(''.join(f"{location} {orientation} {data}\n" for orientation, data in self.samples(segment_data)))
+
+
+class HashedSampler(Sampler):
+    """Writes the same samples to a binary .hashed.samples file, with each word as a 64 bit hash (see HashedSegmentWriter)"""
+    def __init__(self, output_file, sample_size_percent, number_samples, species, chromosome):
+        super().__init__(output_file, sample_size_percent, number_samples)
+        if output_file.tell() == 0:
+            write_hashed_header(output_file, species, chromosome)
+
+    def write_samples(self, location, segment_data):
+        offsets = [int(offset) for offset in location.split()[2:]]
+        records = []
+        for orientation, data in self.samples(segment_data):
+            hashes = word_hashes(data.encode())
+            records.append(HASHED_SAMPLE.pack(*offsets, ORIENTATIONS.index(orientation), len(data), len(hashes)))
+            records.append(hashes.astype("<u8").tobytes())
+        self.output_file.write(b''.join(records))
 
 
 # https://gist.github.com/gajeshbhat/67a3db79a6aecd1db42343190f9a2f17
@@ -235,6 +728,149 @@ def convert_str_to_number(x):
     return int(total_stars)
 
 
+CHECKPOINT_SECONDS = 30
+
+
+def file_hash(filePath, blockSize=1024 * 1024):
+    """sha256 hex digest of the contents of 'filePath'"""
+    sha256 = hashlib.sha256()
+    with open(filePath, "rb") as inFile:
+        for block in iter(lambda: inFile.read(blockSize), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def file_info(filePath):
+    """size and modification time of 'filePath'"""
+    stat = os.stat(filePath)
+    return {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+
+
+def read_json(filePath):
+    """contents of JSON file 'filePath', or None if it does not exist or can not be read"""
+    try:
+        with open(filePath) as inFile:
+            return json.load(inFile)
+    except (OSError, ValueError):
+        return None
+
+
+def write_json(filePath, data):
+    """write 'data' to JSON file 'filePath' using a temporary file and rename, so it is never partly written"""
+    with open(f"{filePath}.tmp", "w") as outFile:
+        json.dump(data, outFile, indent=2)
+    os.replace(f"{filePath}.tmp", filePath)
+
+
+def manifest_matches(manifest, fileToProcess, parameters):
+    """True if the 'manifest' of processed output is for the same parameters and 'fileToProcess' contents.
+
+    The file contents are only hashed when the size is the same but the modification time is not.
+    """
+    if manifest is None or manifest["parameters"] != parameters:
+        return False
+    info = file_info(fileToProcess)
+    if info["size"] != manifest["input"]["size"]:
+        return False
+    return info["mtime"] == manifest["input"]["mtime"] or file_hash(fileToProcess) == manifest["input"]["sha256"]
+
+
+def process_file(species, chromosome, fileToProcess, segmentSize, minWordSize, targetFolder,
+                 sampleSizePercent, numberSamples, minimumNumberWordsPerSegment,
+                 numberSubsequencesToDelete=0, deletedSubsequenceLength=0, workers=1, checkpointSeconds=CHECKPOINT_SECONDS,
+                 compression=None, bulk=False, hashed=False):
+    """write the processed segments and samples of one chromosome file to 'targetFolder', see prepare_for_es for 'workers'
+
+    Returns False, without processing, when the '.manifest' file written next to the '.processed' file shows it is
+    already done for the same file contents and parameters.
+
+    Output is written to '.tmp' files renamed when complete.  About every 'checkpointSeconds' the position of
+    the last joined segment written is saved in a '.checkpoint' file, an interrupted run resumes from there.
+
+    'compression' is None, "gzip" or "zstd" for compressed output files (see open_output), these are not resumed.
+    'bulk' also writes the segments as Elasticsearch _bulk NDJSON to a '.bulk.ndjson' file (see SegmentWriter).
+    'hashed' writes the words of segments and samples as 64 bit hashes to binary '.hashed.processed' and
+    '.hashed.samples' files instead of text (see HashedSegmentWriter), for the local search backends.
+    """
+    if hashed and (compression is not None or bulk):
+        raise ValueError("hashed output is not compressed, and has no words for Elasticsearch _bulk files")
+    name = f"{species}.{chromosome}.{segmentSize}.{minWordSize}"
+    extension = COMPRESSION_EXTENSIONS[compression]
+    hashedExtension = ".hashed" if hashed else ""
+    outputPaths = {"processed": f"{targetFolder}/processed/{name}{hashedExtension}.processed{extension}",
+                   "samples": f"{targetFolder}/samples/{name}{hashedExtension}.samples{extension}"}
+    if bulk:
+        outputPaths["bulk"] = f"{targetFolder}/processed/{name}.bulk.ndjson{extension}"
+    manifestPath = f"{targetFolder}/processed/{name}{hashedExtension}.processed.manifest"
+    checkpointPath = f"{targetFolder}/processed/{name}{hashedExtension}.processed.checkpoint"
+    parameters = {"species": species, "chromosome": chromosome, "file": os.path.abspath(fileToProcess),
+                  "segmentSize": segmentSize, "minWordSize": minWordSize, "sampleSizePercent": sampleSizePercent,
+                  "numberSamples": numberSamples, "minimumNumberWordsPerSegment": minimumNumberWordsPerSegment,
+                  "numberSubsequencesToDelete": numberSubsequencesToDelete, "deletedSubsequenceLength": deletedSubsequenceLength,
+                  "compression": compression, "bulk": bulk}
+    if hashed:
+        parameters["hashed"] = True
+    if all(os.path.isfile(path) for path in outputPaths.values()) and \
+            manifest_matches(read_json(manifestPath), fileToProcess, parameters):
+        return False
+
+    # resume from the checkpoint if it is for the same input and parameters, and at a segment boundary
+    info = file_info(fileToProcess)
+    checkpoint = read_json(checkpointPath) if compression is None else None
+    startOffsets = (0, 0)
+    if checkpoint is not None and checkpoint["parameters"] == parameters and checkpoint["input"] == info and \
+            all(os.path.isfile(f"{path}.tmp") and os.path.getsize(f"{path}.tmp") >= checkpoint["sizes"][output]
+                for output, path in outputPaths.items()) and \
+            tuple(checkpoint["offsets"]) in segmentBoundaries(fileToProcess, segmentSize):
+        startOffsets = tuple(checkpoint["offsets"])
+        sequencesToDelete = checkpoint["sequencesToDelete"]
+        for output, path in outputPaths.items():
+            os.truncate(f"{path}.tmp", checkpoint["sizes"][output])
+        mode = "a"
+    else:
+        sequencesToDelete = deleterFactory(numberSubsequencesToDelete, deletedSubsequenceLength).sequencesToDelete
+        mode = "w"
+
+    if hashed:
+        mode += "b"
+    outputFiles = {output: open_output(f"{path}.tmp", mode, compression) for output, path in outputPaths.items()}
+    try:
+        lastCheckpoint = time.monotonic()
+
+        def flushed(filteredSequenceEndOffset, dataSourceEndOffset):
+            nonlocal lastCheckpoint
+            if compression is None and time.monotonic() - lastCheckpoint >= checkpointSeconds:
+                for outputFile in outputFiles.values():
+                    outputFile.flush()
+                write_json(checkpointPath, {"parameters": parameters, "input": info, "sequencesToDelete": sequencesToDelete,
+                                            "offsets": [filteredSequenceEndOffset, dataSourceEndOffset],
+                                            "sizes": {output: os.fstat(outputFile.fileno()).st_size
+                                                      for output, outputFile in outputFiles.items()}})
+                lastCheckpoint = time.monotonic()
+
+        deleter = sequenceDeleterFactory(sequencesToDelete)
+        wordSplitter = wordSplitterFactory(AT_CG_SPLIT)
+        wordFilter = wordFilterFactory(minWordSize)
+        if hashed:
+            segmentWriter = HashedSegmentWriter(outputFiles["processed"], species, chromosome)
+            sampler = HashedSampler(outputFiles["samples"], sampleSizePercent, numberSamples, species, chromosome)
+        else:
+            segmentWriter = SegmentWriter(outputFiles["processed"], outputFiles.get("bulk"), segmentSize, minWordSize)
+            sampler = Sampler(outputFiles["samples"], sampleSizePercent, numberSamples)
+        prepare_for_es(species, chromosome, fileToProcess, segmentWriter, segmentSize, deleter, wordSplitter, wordFilter, sampler, minimumNumberWordsPerSegment,
+                       workers=workers, startOffsets=startOffsets, flushed=flushed)
+    finally:
+        for outputFile in outputFiles.values():
+            outputFile.close()
+
+    for path in outputPaths.values():
+        os.replace(f"{path}.tmp", path)
+    write_json(manifestPath, {"parameters": parameters, "input": dict(info, sha256=file_hash(fileToProcess))})
+    if os.path.isfile(checkpointPath):
+        os.remove(checkpointPath)
+    return True
+
+
 if __name__ == "__main__":
     import sys
 
@@ -257,11 +893,12 @@ if __name__ == "__main__":
         numberSubsequencesToDelete = int(sys.argv[10])
         deletedSubsequenceLength = int(sys.argv[11])
 
-    with open(f"{targetFolder}/processed/{species}.{chromosome}.{segmentSize}.{minWordSize}.processed", "w") as targetFile, \
-         open(f"{targetFolder}/samples/{species}.{chromosome}.{segmentSize}.{minWordSize}.samples", "w") as sampleFile:
-        deleter = deleterFactory(numberSubsequencesToDelete, deletedSubsequenceLength)
-        wordSplitter = wordSplitterFactory(AT_CG_SPLIT)
-        wordFilter = wordFilterFactory(minWordSize)
-        sampler = Sampler(sampleFile, sampleSizePercent, numberSamples)
-        prepare_for_es(fileToProcess, targetFile, segmentSize, deleter, wordSplitter, wordFilter, sampler, minimumNumberWordsPerSegment)
+    # number of processes for ranges of segments
+    workers = 1
+    if len(sys.argv) > 12:
+        workers = int(sys.argv[12])
 
+    if not process_file(species, chromosome, fileToProcess, segmentSize, minWordSize, targetFolder,
+                        sampleSizePercent, numberSamples, minimumNumberWordsPerSegment,
+                        numberSubsequencesToDelete, deletedSubsequenceLength, workers):
+        print(f"SKIPPING {fileToProcess}, already processed")
@@ -0,0 +1,249 @@
+"""
+Example: python results_store.py --output /genomes/alltest/data.parquet "/genomes/alltest/samples/*.samples.csv"
+
+Search results, the rows written by sample_query.py, in CSV or in a compact binary columnar format:
+
+sp,chr,loc,score,msp,mchr,mloc,orientation,segsize,dsSO,dsEO
+
+The format is from the file extension:
+
+- .csv (or .csv.gz), no header, the same rows as sample_query.py prints
+- .parquet, a Parquet file, or with --partitioned a folder with a sp=<species> folder for each species, so reading
+  some of the species only reads their files
+- .arrow, an Arrow IPC file, the fastest to read back
+
+In Parquet and Arrow files sp, chr, msp, mchr and orientation are dictionary encoded (pandas categoricals), so the
+names are not repeated on every row, loc, mloc, score and segsize are int32 and dsSO, dsEO int64.  These need the
+pyarrow package (pip install pyarrow).
+
+The command reads result files in any of these formats and writes them to one --output file, e.g. to replace
+'cat *.samples.csv > data.csv'.
+"""
+import click
+import io
+import json
+import os
+import shutil
+
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+try:
+    from file_patterns import expand_files
+except ImportError:
+    from script_tools.file_patterns import expand_files
+
+try:
+    import pyarrow
+    import pyarrow.dataset
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+RESULT_COLUMNS = ['sp', 'chr', 'loc', 'score', 'msp', 'mchr', 'mloc', 'orientation', 'segsize', 'dsSO', 'dsEO']
+CATEGORY_COLUMNS = ['sp', 'chr', 'msp', 'mchr', 'orientation']
+INTEGER_TYPES = {'loc': 'int32', 'score': 'int32', 'mloc': 'int32', 'segsize': 'int32', 'dsSO': 'int64', 'dsEO': 'int64'}
+RESULT_FORMATS = {".parquet": "parquet", ".arrow": "arrow"}
+CHUNK_ROWS = 1000000
+
+
+def results_format(path):
+    """"parquet", "arrow" or "csv", from the extension of results 'path'"""
+    return RESULT_FORMATS.get(os.path.splitext(os.path.normpath(path))[1], "csv")
+
+
+def require_pyarrow(path):
+    if pyarrow is None:
+        raise ValueError(f"{path}: Parquet and Arrow results need the pyarrow package, pip install pyarrow")
+
+
+def results_frame(df):
+    """'df' with the result columns it has in order, categorical names and int32/int64 numbers"""
+    columns = [column for column in RESULT_COLUMNS if column in df.columns]
+    df = df[columns]
+    # names read as numbers, like chromosome 1, are kept as strings
+    names = {column: df[column].astype(str) for column in CATEGORY_COLUMNS
+             if column in columns and not isinstance(df[column].dtype, pd.CategoricalDtype)}
+    types = {column: 'category' for column in CATEGORY_COLUMNS}
+    types.update(INTEGER_TYPES)
+    return df.assign(**names).astype({column: types[column] for column in columns})
+
+
+def empty_results():
+    return results_frame(pd.DataFrame({column: [] for column in RESULT_COLUMNS}))
+
+
+def read_csv_results(file, chunkRows=None):
+    """DataFrame of headerless CSV result rows in 'file', a file name or file object.
+
+    With 'chunkRows' returns an iterator of DataFrames of up to that many rows instead.
+    """
+    try:
+        df = pd.read_csv(file, header=None, index_col=False, names=RESULT_COLUMNS, chunksize=chunkRows,
+                         compression="gzip" if isinstance(file, str) and file.endswith(".gz") else None,
+                         dtype={column: str for column in CATEGORY_COLUMNS})
+    except pd.errors.EmptyDataError:
+        # samples without any hits
+        return iter([]) if chunkRows else empty_results()
+    return (results_frame(chunk) for chunk in df) if chunkRows else results_frame(df)
+
+
+def rows_frame(rows):
+    """DataFrame of CSV rows from sample_query.csv_rows"""
+    return read_csv_results(io.StringIO(''.join(f"{row}\n" for row in rows)))
+
+
+def read_results(path, species=None, columns=None):
+    """DataFrame of the results in 'path', a file in any of the formats, or a partitioned .parquet folder.
+
+    'species' is a list of the sampled species to read, for a partitioned folder only their files are read.
+    'columns' is a list of the columns to read, all of them by default.
+    """
+    resultsFormat = results_format(path)
+    if resultsFormat == "csv":
+        df = read_csv_results(path)
+    else:
+        require_pyarrow(path)
+        if resultsFormat == "parquet":
+            filters = [("sp", "in", list(species))] if species is not None else None
+            df = pd.read_parquet(path, columns=columns, filters=filters)
+        else:
+            df = pd.read_feather(path, columns=columns)
+    if species is not None and resultsFormat != "parquet":
+        df = df[df['sp'].isin(species)]
+    if columns is not None:
+        df = df[columns]
+    df = results_frame(df).reset_index(drop=True)
+    if species is not None and 'sp' in df.columns:
+        df['sp'] = df['sp'].cat.remove_unused_categories()
+    return df
+
+
+def read_results_chunks(path, chunkRows=CHUNK_ROWS):
+    """Yields the results in 'path' as DataFrames of up to 'chunkRows' rows, numbered by their row in the file.
+
+    'path' is a file in any of the formats, a partitioned .parquet folder, or a CSV file object like sys.stdin.
+    """
+    if not isinstance(path, str) or results_format(path) == "csv":
+        chunks = read_csv_results(path, chunkRows)
+    else:
+        require_pyarrow(path)
+        if results_format(path) == "parquet":
+            batches = pyarrow.dataset.dataset(path, format="parquet", partitioning="hive").to_batches(batch_size=chunkRows)
+        else:
+            reader = pyarrow.ipc.open_file(pyarrow.memory_map(path))
+            batches = (reader.get_batch(i).slice(offset, chunkRows) for i in range(reader.num_record_batches)
+                       for offset in range(0, reader.get_batch(i).num_rows, chunkRows))
+        chunks = (results_frame(batch.to_pandas()) for batch in batches)
+    start = 0
+    for chunk in chunks:
+        chunk.index = pd.RangeIndex(start, start + len(chunk))
+        start += len(chunk)
+        yield chunk
+
+
+def read_chunks(path, columns, names=None, chunkRows=CHUNK_ROWS):
+    """Yields DataFrames of up to 'chunkRows' rows of 'columns' of 'path', with categorical names.
+
+    'path' is a CSV file with a header line, or a .parquet or .arrow results file, where the results column read
+    for each of 'columns' is from 'names' if it is there, e.g. {'segloc': 'loc'}.
+    """
+    if results_format(path) == "csv":
+        dtype = {column: 'category' if column in CATEGORY_COLUMNS else 'int64' for column in columns}
+        yield from pd.read_csv(path, compression='infer', index_col=False, usecols=columns, dtype=dtype, chunksize=chunkRows)
+        return
+    names = names or {}
+    for chunk in read_results_chunks(path, chunkRows):
+        yield chunk[[names.get(column, column) for column in columns]].set_axis(columns, axis=1)
+
+
+def concat_results(frames, columns):
+    """concatenates DataFrames with 'columns', categorical columns stay categorical when their categories differ"""
+    frames = list(frames)
+    if not frames:
+        return pd.DataFrame({column: [] for column in columns})
+    categorical = {column: union_categoricals([frame[column] for frame in frames])
+                   for column in columns if isinstance(frames[0][column].dtype, pd.CategoricalDtype)}
+    df = pd.concat([frame.drop(columns=list(categorical)) for frame in frames], ignore_index=True)
+    return df.assign(**categorical)[columns]
+
+
+def score_statistics(path, chunks):
+    """(number of rows, sum of scores) of the results in 'path', read with 'chunks(columns)' (see read_chunks).
+
+    These are kept in '<path>.stats.json' and read from there while the size and modification time of 'path' are the same.
+    """
+    stat = os.stat(path)
+    statsPath = f"{os.path.normpath(path)}.stats.json"
+    try:
+        with open(statsPath) as statsFile:
+            stats = json.load(statsFile)
+        if stats["size"] == stat.st_size and stats["mtime"] == stat.st_mtime_ns:
+            return stats["count"], stats["sum"]
+    except (OSError, ValueError, KeyError):
+        pass
+    count = total = 0
+    for chunk in chunks(['score']):
+        count += len(chunk)
+        total += int(chunk['score'].sum())
+    try:
+        with open(f"{statsPath}.tmp", "w") as statsFile:
+            json.dump({"size": stat.st_size, "mtime": stat.st_mtime_ns, "count": count, "sum": total}, statsFile)
+        os.replace(f"{statsPath}.tmp", statsPath)
+    except OSError:
+        # a read only folder, the statistics are read again next time
+        pass
+    return count, total
+
+
+def above_mean_chunks(path, chunks, columns):
+    """Yields the chunks of 'columns' of the results in 'path' with rows scoring above the mean score, read with
+    'chunks(columns)' in two passes, the first for the mean unless it is in the stored statistics"""
+    count, total = score_statistics(path, chunks)
+    meanScore = int(total / count) if count else 0
+    for chunk in chunks(columns):
+        yield chunk[chunk['score'] > meanScore]
+
+
+def write_results(df, path, partitioned=False):
+    """writes results 'df' to 'path' in the format of its extension, with a temporary file and rename.
+
+    'partitioned' writes a .parquet folder with a sp=<species> folder for each species.
+    """
+    resultsFormat = results_format(path)
+    df = results_frame(df)
+    tmpPath = f"{path}.tmp"
+    if os.path.isdir(tmpPath):
+        shutil.rmtree(tmpPath)
+    if resultsFormat == "csv":
+        df.to_csv(tmpPath, header=False, index=False, compression="gzip" if path.endswith(".gz") else None)
+    else:
+        require_pyarrow(path)
+        table = pyarrow.Table.from_pandas(df, preserve_index=False)
+        if resultsFormat == "arrow":
+            with pyarrow.ipc.new_file(tmpPath, table.schema) as writer:
+                writer.write_table(table)
+        elif partitioned:
+            pyarrow.parquet.write_to_dataset(table, tmpPath, partition_cols=['sp'])
+        else:
+            pyarrow.parquet.write_table(table, tmpPath)
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    os.replace(tmpPath, path)
+
+
+@click.command()
+@click.option("--output", prompt="output file", help="results file to write, .csv, .parquet or .arrow")
+@click.option("--partitioned/--no-partitioned", default=True, help="write a .parquet folder partitioned by species")
+@click.argument("files", nargs=-1)
+def combine(output, partitioned, files):
+    files = expand_files(files)
+    frames = [read_results(file) for file in files]
+    df = pd.concat(frames, ignore_index=True) if frames else rows_frame([])
+    write_results(df, output, partitioned)
+    print(f"wrote {len(df)} results of {len(files)} files to {output}")
+
+
+if __name__ == "__main__":
+    combine()
@@ -0,0 +1,25 @@
+"""
+Reverse complement of sequence data, as str or bytes.
+
+IUPAC nucleotide codes are complemented (e.g. R, A or G, becomes Y, C or T), lowercase soft-masked values stay
+lowercase, U is complemented like T.  Anything else, e.g. spaces between words, is unchanged.
+
+Example:
+
+    revcomp("ACGTN acgtr")  # "yacgt NACGT"
+"""
+IUPAC = "ACGTUMRWSYKVHDBN"
+IUPAC_COMPLEMENT = "TGCAAKYWSRMBDHVN"
+
+STR_COMPLEMENT = str.maketrans(IUPAC + IUPAC.lower(), IUPAC_COMPLEMENT + IUPAC_COMPLEMENT.lower())
+BYTES_COMPLEMENT = bytes.maketrans((IUPAC + IUPAC.lower()).encode(), (IUPAC_COMPLEMENT + IUPAC_COMPLEMENT.lower()).encode())
+
+
+def complement(s):
+    """complement of each value in 's', a str or bytes"""
+    return s.translate(BYTES_COMPLEMENT if isinstance(s, (bytes, bytearray)) else STR_COMPLEMENT)
+
+
+def revcomp(s):
+    """reverse complement of 's', a str or bytes"""
+    return complement(s)[::-1]
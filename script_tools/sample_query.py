@@ -2,16 +2,84 @@ import click
 import json
 import requests
 
+from local_index import LocalIndex, read_hashed_samples
+from minhash_index import MinHashIndex
+from results_store import rows_frame, write_results
+
+MUST = '"must": { "match": { "FIELD": "VALUE" }}'
+QUERY = '{ "_source": { "excludes": ["data", "message"] }, "query": { "bool": { BOOL_QUERY }}}'
+# only the parts of the search response used for the CSV rows
+SEARCH_FILTER_PATH = "hits.hits._score,hits.hits._source"
+# backends searching an index folder in this process, instead of Elasticsearch
+LOCAL_BACKENDS = {"local": LocalIndex, "minhash": MinHashIndex}
+
+
+def read_samples(query):
+    """Yields (species, chromosome, segment_start_offset, orientation, data) for each sample in the 'query' samples file.
+
+    For a .hashed.samples file 'data' is the word hashes, which only the local and minhash backends can search.
+    """
+    if query.endswith(".hashed.samples"):
+        yield from read_hashed_samples(query)
+        return
+    with open(query) as q:
+        for line in q:
+            if len(line) > 100:
+                (species, chromosome, source_file_start_offset, source_file_end_offset, segment_start_offset,
+                 segment_end_offset, orientation, data) = line.rstrip().split(' ', maxsplit=7)
+                # human X 151 1014436 0 1000000 True TGGTGAAACCTC ACAG..
+                # 0     1 2   3       4 5       6    7:
+                yield species, chromosome, segment_start_offset, orientation, data
+
+
+def sample_search(data):
+    """Elasticsearch query for segments matching sample 'data'"""
+    if not isinstance(data, str):
+        raise ValueError("samples from .hashed.samples files can only be searched with the local and minhash backends")
+    return QUERY.replace("BOOL_QUERY", MUST.replace("FIELD", "data").replace("VALUE", data))
+
+
+def csv_rows(sample, es_response):
+    """Yields a CSV row for each hit in the search response for 'sample' from read_samples:
+
+    sp,chr,loc,score,msp,mchr,mloc,orientation,segsize,dsSO,dsEO
+    """
+    species, chromosome, segment_start_offset, orientation, data = sample
+    for x in es_response:
+        if x == 'hits':
+            for y in es_response['hits']['hits']:
+                score = int(y['_score'])
+                msp = y['_source']['sp']
+                mchr = y['_source']['chr']
+                mloc = int(y['_source']['segloc'])
+                seg_size = int(y['_source']['sEO']) - mloc
+                dsSO = y['_source']['dSO']
+                dsEO = y['_source']['dEO']
+                yield f"{species},{chromosome},{segment_start_offset},{score},{msp},{mchr},{mloc},{orientation},{seg_size},{dsSO},{dsEO}"
+
+
+def elasticsearch_search(session, esurl, index):
+    """search function for sample data, returning the Elasticsearch search response"""
+    def search(data):
+        response = session.get(f"{esurl}/{index}/_search",
+                               params={"filter_path": SEARCH_FILTER_PATH},
+                               data=sample_search(data),
+                               headers={'content-type': 'application/json'}
+                               )
+        return json.loads(response.text)
+    return search
+
 
 @click.command()
 @click.option("--query", prompt="Input query file", help="Input query file")
-@click.option("--index", prompt="target index", help="target index")
-@click.option("--esurl", prompt="Elasticsearch URL", help="Elasticsearch URL")
-def doquery(esurl, query, index):
+@click.option("--index", prompt="target index", help="target index, or index folder for the local and minhash backends")
+@click.option("--esurl", help="Elasticsearch URL")
+@click.option("--backend", type=click.Choice(["elasticsearch", *LOCAL_BACKENDS]), default="elasticsearch",
+              help="search with Elasticsearch, or with an index folder written by local_index.py or minhash_index.py")
+@click.option("--results", help="write the rows to a .csv, .parquet or .arrow results file (see results_store.py) instead of printing them")
+def doquery(esurl, query, index, backend, results):
     MUST_NOT = '"must_not": { "match": { "FIELD": "VALUE" }}'
-    MUST = '"must": { "match": { "FIELD": "VALUE" }}'
     RANGE = '"filter": { "range": { "FIELD": { OPVAL_LIST }}}'
-    QUERY = '{ "_source": { "excludes": ["data", "message"] }, "query": { "bool": { BOOL_QUERY }}}'
 
     def qline(line):
         line = line.strip()
@@ -43,34 +111,16 @@ def doquery(esurl, query, index):
                 offset += 2
             return RANGE.replace("FIELD", data[0]).replace("OPVAL_LIST", ",".join(opvals))
 
-    with open(query) as q:
-        for line in q:
-            if len(line) > 100:
-                (species, chromosome, source_file_start_offset, source_file_end_offset, segment_start_offset,
-                 segment_end_offset, orientation, data) = line.rstrip().split(' ', maxsplit=7)
-                qline = MUST.replace("FIELD", "data").replace("VALUE", data)
-                # human X 151 1014436 0 1000000 True TGGTGAAACCTC ACAG..
-                # 0     1 2   3       4 5       6    7:
-                esquery = QUERY.replace("BOOL_QUERY", qline)
-                # print(esquery)
-                response = requests.get(f"{esurl}/{index}/_search",
-                                        data=esquery,
-                                        headers={'content-type': 'application/json'}
-                                        )
-                es_response = json.loads(response.text)
-                for x in es_response:
-                    if x == 'hits':
-                        for y in es_response['hits']['hits']:
-                            score = int(y['_score'])
-                            msp = y['_source']['sp']
-                            mchr = y['_source']['chr']
-                            mloc = int(y['_source']['segloc'])
-                            seg_size = int(y['_source']['sEO']) - mloc
-                            dsSO = y['_source']['dSO']
-                            dsEO = y['_source']['dEO']
-                            print(
-                                f"{species},{chromosome},{segment_start_offset},{score},{msp},{mchr},{mloc},{orientation},{seg_size},{dsSO},{dsEO}")
-                # print(response.text)
+    if backend == "elasticsearch" and esurl is None:
+        raise click.UsageError("--esurl is needed for the elasticsearch backend")
+    with requests.Session() as session:
+        search = LOCAL_BACKENDS[backend](index).search if backend in LOCAL_BACKENDS else elasticsearch_search(session, esurl, index)
+        if results is not None:
+            write_results(rows_frame(row for sample in read_samples(query) for row in csv_rows(sample, search(sample[4]))), results)
+            return
+        for sample in read_samples(query):
+            for row in csv_rows(sample, search(sample[4])):
+                print(row)
 
 
 if __name__ == "__main__":
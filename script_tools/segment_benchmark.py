@@ -0,0 +1,94 @@
+"""
+Micro-benchmark of SegmentGenerator against the string concatenation segment generator it replaced.
+
+Example: python segment_benchmark.py ../experiments/configurations/3_primate_test/rawdata/hg38/chr3.fa
+
+Without a FASTA file a random sequence of 60 character lines is used.  Both generators are timed
+with the line by line DataSourceFilter, and with ChunkedDataSourceFilter for a FASTA file, for 1M
+and 100k segment sizes.  Segments are checked to be the same for all generators.
+"""
+import random
+import sys
+import time
+
+from processing import DataSourceFilter, ChunkedDataSourceFilter, SegmentGenerator
+
+
+class ConcatenatingSegmentGenerator(SegmentGenerator):
+    """SegmentGenerator before it joined the sequences once per segment"""
+    def segments(self):
+        filteredSequenceStartOffset = 0
+        segmentdataSourceStartOffset = 0
+        segmentdataSourceEndOffset = 0
+        segmentData = ""
+        for sequenceStartOffset, sequenceEndOffset, data in self.dataSourceFilter.sequences():
+            if segmentData == "":
+                segmentdataSourceStartOffset = sequenceStartOffset
+                segmentData = data
+                segmentdataSourceEndOffset = sequenceEndOffset
+            else:
+                segmentData += data
+                segmentdataSourceEndOffset = sequenceEndOffset
+
+            while len(segmentData) > self.segmentSize:
+                remainingSegmentData = segmentData[self.segmentSize:]
+                segmentData = segmentData[:self.segmentSize]
+                remainingDataSourceOffset = sequenceStartOffset + len(data) - len(remainingSegmentData)
+                yield (segmentdataSourceStartOffset,
+                       remainingDataSourceOffset,
+                       filteredSequenceStartOffset,
+                       filteredSequenceStartOffset + self.segmentSize,
+                       segmentData)
+                segmentData = remainingSegmentData
+                segmentdataSourceStartOffset = remainingDataSourceOffset
+                filteredSequenceStartOffset += self.segmentSize
+
+        yield (segmentdataSourceStartOffset, segmentdataSourceEndOffset, filteredSequenceStartOffset, filteredSequenceStartOffset + len(segmentData), segmentData)
+
+
+class RandomSequences:
+    """Same output as DataSourceFilter for a FASTA file with 'numberLines' random 60 character lines"""
+    def __init__(self, numberLines, lineLength=60):
+        random.seed(0)
+        self.lines = [''.join(random.choices("ACGTN", k=lineLength)) for i in range(numberLines)]
+
+    def sequences(self):
+        dataOffset = 0
+        for line in self.lines:
+            yield (dataOffset, dataOffset + len(line), line)
+            dataOffset += len(line) + 1
+
+
+def time_segments(segmentGenerator, repeat=3):
+    """Returns best time of 'repeat' runs, and the segments with a hash of the segment data"""
+    seconds = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        segments = [segment[:4] + (hash(segment[4]),) for segment in segmentGenerator.segments()]
+        seconds.append(time.perf_counter() - start)
+    return min(seconds), segments
+
+
+if __name__ == "__main__":
+    for segmentSize in [1000000, 100000]:
+        if len(sys.argv) > 1:
+            lineSource = DataSourceFilter(sys.argv[1])
+            blockSource = ChunkedDataSourceFilter(sys.argv[1], alignment=segmentSize)
+            generators = [("concatenating, lines", ConcatenatingSegmentGenerator(lineSource, segmentSize)),
+                          ("joining, lines", SegmentGenerator(lineSource, segmentSize)),
+                          ("concatenating, blocks", ConcatenatingSegmentGenerator(blockSource, segmentSize)),
+                          ("joining, blocks", SegmentGenerator(blockSource, segmentSize))]
+        else:
+            lineSource = RandomSequences(500000)
+            generators = [("concatenating, lines", ConcatenatingSegmentGenerator(lineSource, segmentSize)),
+                          ("joining, lines", SegmentGenerator(lineSource, segmentSize))]
+
+        print(f"segment size {segmentSize}")
+        expected = None
+        for name, generator in generators:
+            seconds, segments = time_segments(generator)
+            if expected is None:
+                expected = segments
+            elif segments != expected:
+                print(f"  {name}: DIFFERENT SEGMENTS")
+            print(f"  {name}: {len(segments)} segments, {seconds:.3f} seconds")
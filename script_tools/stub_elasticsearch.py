@@ -0,0 +1,206 @@
+"""
+Stub Elasticsearch HTTP server, for checking and timing the query scripts without a real cluster.
+
+Example: python stub_elasticsearch.py --samples ../experiments/alltest/samples/hg38.3.50000.14.samples --msearch 50
+
+Answers _search and _msearch requests with made up hits that only depend on the sample data, so the CSV rows
+are the same for any batching.  Indices can be created and loaded with _bulk, with their settings and _refresh,
+as used by bulk_load.py, and _count of a species.  With --samples, async_sample_query.py runs against the stub with one _search
+per sample and with _msearch batches, the CSV files are checked to be the same, and the times are printed.
+
+The stub can also be used from Python:
+
+    with StubElasticsearch(busyEvery=10) as url:
+        ...  # every 10th request, _msearch search and _bulk document is rejected with status 429
+"""
+import asyncio
+import click
+import filecmp
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from async_sample_query import msearch_batches, msearch_rows, query_files
+
+
+def stub_hits(data):
+    """made up search hits for sample 'data', from 0 to 3 hits"""
+    h = zlib.crc32(data.encode())
+    return [{"_score": (h % 1000) / 7 + i,
+             "_source": {"sp": f"sp{i}", "chr": str(h % 23), "segloc": h % 100000 * 10, "sEO": h % 100000 * 10 + 50000,
+                         "dSO": h % 777, "dEO": h % 999 + 1000}}
+            for i in range(h % 4)]
+
+
+def stub_search(query):
+    """search response for a query from sample_query.sample_search"""
+    return {"took": 1, "timed_out": False, "hits": {"total": {"value": 0, "relation": "eq"},
+                                                  "hits": stub_hits(query["query"]["bool"]["must"]["match"]["data"])}}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # the response is sent in one write, otherwise Nagle's algorithm delays keep-alive responses
+    wbufsize = 64 * 1024
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, response):
+        body = json.dumps(response).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def handle_request(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            busy = server.busyEvery and server.requests % server.busyEvery == 0
+        if busy:
+            return self.send_json(429, {"error": {"type": "es_rejected_execution_exception"}, "status": 429})
+        path = self.path.split("?")[0]
+        if path.endswith("/_search"):
+            return self.send_json(200, stub_search(json.loads(body)))
+        if path.endswith("/_msearch"):
+            return self.send_json(200, {"took": 1, "responses": self.msearch(body.decode().splitlines())})
+        parts = path.strip("/").split("/")
+        with server.lock:
+            index = server.indices.get(parts[0])
+            if len(parts) == 1 and self.command == "PUT":
+                if index is not None:
+                    return self.send_json(400, {"error": {"type": "resource_already_exists_exception"}, "status": 400})
+                server.indices[parts[0]] = {"settings": {}, "documents": {}}
+                return self.send_json(200, {"acknowledged": True})
+            if index is None:
+                return self.send_json(404, {"error": {"type": "index_not_found_exception"}, "status": 404})
+            if parts[1:2] == ["_bulk"]:
+                return self.send_json(200, self.bulk(index, body.decode().splitlines()))
+            if parts[1:2] == ["_settings"] and self.command == "PUT":
+                for name, value in json.loads(body).items():
+                    if value is None:
+                        index["settings"].pop(name, None)
+                    else:
+                        index["settings"][name] = str(value)
+                return self.send_json(200, {"acknowledged": True})
+            if parts[1:2] == ["_settings"]:
+                return self.send_json(200, {parts[0]: {"settings": dict(index["settings"])}})
+            if parts[1:2] == ["_refresh"]:
+                return self.send_json(200, {"_shards": {"failed": 0}})
+            if parts[1:2] == ["_count"]:
+                species = json.loads(body)["query"]["match_phrase"]["sp"]
+                count = sum(1 for document in index["documents"].values() if document["sp"] == species)
+                return self.send_json(200, {"count": count})
+        self.send_json(404, {"error": f"{self.command} {path} is not supported by the stub", "status": 404})
+
+    def msearch(self, lines):
+        """_msearch responses, with busyEvery every n-th search is rejected with status 429, a search is only
+        rejected once, so it is answered when it is sent again"""
+        server = self.server
+        responses = []
+        for query in lines[1::2]:
+            with server.lock:
+                server.searches += 1
+                busy = server.busyEvery and server.searches % server.busyEvery == 0 and query not in server.rejectedSearches
+                if busy:
+                    server.rejectedSearches.add(query)
+            if busy:
+                responses.append({"error": {"type": "es_rejected_execution_exception"}, "status": 429})
+            else:
+                responses.append(dict(stub_search(json.loads(query)), status=200))
+        return responses
+
+    def bulk(self, index, lines):
+        """_bulk index actions, with busyEvery every n-th document is rejected with status 429"""
+        server = self.server
+        items = []
+        for action, document in zip(lines[::2], lines[1::2]):
+            server.documents += 1
+            if server.busyEvery and server.documents % server.busyEvery == 0:
+                items.append({"index": {"status": 429, "error": {"type": "es_rejected_execution_exception"}}})
+                continue
+            _id = json.loads(action)["index"]["_id"]
+            index["documents"][_id] = json.loads(document)
+            items.append({"index": {"_id": _id, "status": 201, "result": "created"}})
+        return {"took": 1, "errors": any(item["index"]["status"] >= 300 for item in items), "items": items}
+
+    do_GET = do_POST = do_PUT = handle_request
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # listen backlog, the default of 5 is less than the concurrency of the clients, and connections
+    # over the backlog are retried after about a second, which would be in the _search times
+    request_queue_size = 128
+
+
+class StubElasticsearch:
+    """Runs the stub server in a thread, the context manager value is its URL"""
+    def __init__(self, port=0, busyEvery=0):
+        self.server = StubServer(("127.0.0.1", port), StubHandler)
+        self.server.lock = threading.Lock()
+        self.server.requests = 0
+        self.server.searches = 0
+        self.server.rejectedSearches = set()
+        self.server.documents = 0
+        self.server.indices = {}
+        self.server.busyEvery = busyEvery
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.url
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def time_queries(url, files, concurrency, batches=None, query_rows=None):
+    """Returns seconds to query with 'files' from async_sample_query.query_files"""
+    start = time.perf_counter()
+    kwargs = {} if batches is None else {"batches": batches, "query_rows": query_rows}
+    failures = asyncio.run(query_files(url, "stub", files, concurrency, retries=5, **kwargs))
+    if failures:
+        raise next(iter(failures.values()))
+    return time.perf_counter() - start
+
+
+@click.command()
+@click.option("--port", type=int, default=9200, help="port to serve on, without --samples")
+@click.option("--busyevery", type=int, default=0, help="reject every n-th request, _msearch search and _bulk document with status 429")
+@click.option("--samples", help="samples file to time queries with")
+@click.option("--concurrency", type=int, default=8, help="number of requests sent at the same time")
+@click.option("--msearch", type=int, default=50, help="number of searches in each _msearch request")
+def stub(port, busyevery, samples, concurrency, msearch):
+    if samples is None:
+        print(f"stub Elasticsearch on http://127.0.0.1:{port}")
+        StubElasticsearch(port, busyevery).server.serve_forever()
+        return
+
+    folder = tempfile.mkdtemp()
+    try:
+        searchFile = shutil.copy(samples, f"{folder}/search.samples")
+        msearchFile = shutil.copy(samples, f"{folder}/msearch.samples")
+        with StubElasticsearch(busyEvery=busyevery) as url:
+            searchSeconds = time_queries(url, [searchFile], concurrency)
+            msearchSeconds = time_queries(url, [msearchFile], concurrency,
+                                          lambda s: msearch_batches(s, msearch), msearch_rows)
+        same = filecmp.cmp(f"{searchFile}.csv", f"{msearchFile}.csv", shallow=False)
+        print(f"_search: {searchSeconds:.3f} seconds, _msearch of {msearch}: {msearchSeconds:.3f} seconds, "
+              f"{'same' if same else 'DIFFERENT'} CSV rows ({os.path.getsize(f'{searchFile}.csv')} bytes)")
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == "__main__":
+    stub()
@@ -19,24 +19,37 @@ DataFrame columns listed below, only "score", "sloc", and "mloc" columns are 'in
   """
 import pandas as pd
 
+from script_tools.results_store import above_mean_chunks, concat_results, read_chunks
+
+COLUMNS = ['sp', 'chr', 'sloc', 'score', 'msp', 'mchr', 'mloc', 'orientation', 'segsize']
+
+
+def comparison_chunks(csvFile):
+    """chunks(columns) function for read_chunks of 'csvFile', results files have loc where the CSV file has sloc"""
+    return lambda columns: read_chunks(csvFile, columns, {'sloc': 'loc'})
+
 
 def read_genome_comparison_csv(csvFile):
-    """Return DataFrame for the CSV file that resulted from Elasticsearch scoring of relationships."""
-    compression = "gzip" if csvFile.endswith(".gz") else None
-    df = pd.read_csv(csvFile,
-                     compression=compression,
-                     index_col=False,
-                     usecols=['sp', 'chr', 'sloc', 'score', 'msp', 'mchr', 'mloc', 'orientation', 'segsize'],
-                     dtype={'sp': str, 'chr': str, 'sloc': int,
-                            'score': int,
-                            'msp': str, 'mchr': str, 'mloc': int,
-                            'orientation': str, 'segsize': int, 'dsSO': int, 'dsEO': int})
-    mean_score = int(df['score'].mean())
-    return df[df['score'] > mean_score]
+    """Return DataFrame for the CSV file that resulted from Elasticsearch scoring of relationships.
+
+    The names are categoricals.  A .parquet or .arrow results file (see script_tools/results_store.py) can be
+    read too.  The file is read in chunks, only records above the mean score are kept.
+    """
+    return concat_results(above_mean_chunks(csvFile, comparison_chunks(csvFile), COLUMNS), COLUMNS)
 
 
 def confusion_matrix_data(df):
-    return df.groupby(['sp', 'chr', 'msp', 'mchr'], as_index=False)['sloc'].count()
+    return df.groupby(['sp', 'chr', 'msp', 'mchr'], as_index=False, observed=True)['sloc'].count()
+
+
+def read_confusion_matrix_data(csvFile):
+    """confusion_matrix_data of read_genome_comparison_csv(csvFile), counted chunk by chunk"""
+    columns = ['sp', 'chr', 'msp', 'mchr', 'sloc', 'score']
+    counts = [confusion_matrix_data(chunk) for chunk in above_mean_chunks(csvFile, comparison_chunks(csvFile), columns)]
+    if not counts:
+        return pd.DataFrame({column: [] for column in ['sp', 'chr', 'msp', 'mchr', 'sloc']})
+    df = pd.concat(counts, ignore_index=True).astype({column: str for column in ['sp', 'chr', 'msp', 'mchr']})
+    return df.groupby(['sp', 'chr', 'msp', 'mchr'], as_index=False)['sloc'].sum()
 
 
 def species_to_species(df):
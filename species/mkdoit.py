@@ -5,7 +5,7 @@ version = "1"
 @click.command()
 @click.option("--files",
               help="text file with list of files to processes, each line with <species> <chromosome> <filePath>")
-@click.option('--logstash/--no-logstash', default=True)
+@click.option('--load/--no-load', default=True, help="load the processed files into elasticsearch with bulk_load.py")
 @click.option("--segsize", help="segment size", type=int)
 @click.option("--wordlen", help="minimum word length", type=int)
 @click.option("--targetfolder", help="path to results folder")
@@ -15,75 +15,49 @@ version = "1"
               help="number of samples to generate, doubled because reverse complement samples also generated")
 @click.option("--ndel", help="number of random subsequences to delete")
 @click.option("--ndellen", help="length of each random subsequence to delete")
+@click.option("--resultsformat", type=click.Choice(["csv", "parquet"]), default="csv",
+              help="combine the results in data.csv, or with max_score.py and results_store.py in data.parquet partitioned by species")
 
-def gen_script(files, logstash, segsize, wordlen, targetfolder, targetindex, samplesizepercent, numbersamples, ndel, ndellen):
+def gen_script(files, load, segsize, wordlen, targetfolder, targetindex, samplesizepercent, numbersamples, ndel, ndellen, resultsformat):
     print("#")
     print(f"# generated with mkdoit.py, version {version}")
     print("#")
-    logstash_val = "--no-logstash"
-    if logstash:
-        logstash_val = "--logstash"
-    print(f"#   python mkdoit.py --files {files} {logstash_val} --segsize {segsize} --wordlen {wordlen} --targetfolder {targetfolder} --targetindex {targetindex} --samplesizepercent {samplesizepercent} --numbersamples {numbersamples} --ndel {ndel} --ndellen {ndellen}")
+    load_val = "--no-load"
+    if load:
+        load_val = "--load"
+    print(f"#   python mkdoit.py --files {files} {load_val} --segsize {segsize} --wordlen {wordlen} --targetfolder {targetfolder} --targetindex {targetindex} --samplesizepercent {samplesizepercent} --numbersamples {numbersamples} --ndel {ndel} --ndellen {ndellen} --resultsformat {resultsformat}")
     print("#")
 
     print("set -x")
-    print(f"mkdir -p {targetfolder}")
+    print(f"mkdir -p {targetfolder}/processed {targetfolder}/samples")
     print(f"mkdir -p {targetfolder}_max")
     lines = open(files, "r").readlines()
 
-    def generate_logstash_config():
-        print(f"echo 'creating logstash config file: logstash_{targetindex}.conf'")
-        s = f"{targetfolder}".replace("/", "\\/")
-        mkLogstash = f"sed -e \"s/__TARGET_FOLDER__/{s}/\" ../templates/logstash_to_es.conf.template"
-        conf_file = f"{targetfolder}/logstash_{targetindex}.conf"
-        print(f"{mkLogstash} > {conf_file}x")
-        mkLogstash = f"sed -e \"s/__ELASTICSEARCH_INDEX__/{targetindex}/\" {targetfolder}/logstash_{targetindex}.confx"
-        print(f"{mkLogstash} > {conf_file}")
-        # TODO: this is specific to my installation!  need this for repeated tests
-        logstash_start_script = f"{targetfolder}/start_logstash_{targetindex}"
-
-        print(
-            f"echo 'rm /usr/local/Cellar/logstash/7.6.2/libexec/data/plugins/inputs/file/.sincedb*' > {logstash_start_script}")
-        print(f"echo 'logstash -f {conf_file} &' > {logstash_start_script}")
-        print(f"chmod +x {logstash_start_script}")
-        print(f"read -p 'STOP LOGSTASH NOW!  then press ENTER'")
-        print(f"{logstash_start_script}")
-
-    if logstash:
-        generate_logstash_config()
-
-    speciesSet = set()
-
     for line in lines:
         species, chromosome, filePath = line.strip().split()
-        speciesSet.add(species)
         print(
             f"python processing.py {species} {chromosome} {filePath} {segsize} {wordlen} {targetfolder} {samplesizepercent} {numbersamples} {ndel} {ndellen}")
 
-    # these are check against elasticsearch record counts (once logstash has loaded those -- how can we tell it is done?)
-    for species in speciesSet:
-        print(f"cat {targetfolder}/{species}.*.processed | wc > {targetfolder}/{species}.line_count")
-    #
-    # TODO: verify count against elasticsearch before sampling
-    # maybe at this point, we query elasticsearch, waiting for now records to be inserted, then
-    # counting
-    #count = defaultdict(int)
-    #elasticsearch = ElasticSearcher(index)
-    #for species in speciesSet:
-    #    count[species] = elasticsearch.count({'sp': species})
-    print("sleep 60")
+    # bulk_load.py returns once every segment is in the index, and fails if a segment is not indexed or none are read
+    if load:
+        print(f"python bulk_load.py --esurl localhost:9200 --index {targetindex} \"{targetfolder}/processed/*.processed\"")
 
     # sample queries go out to a CSV
     for line in lines:
         species, chromosome, filePath = line.strip().split()
-        sampleFilePath = f"{targetfolder}/{species}.{chromosome}.{segsize}.{wordlen}.samples"
+        sampleFilePath = f"{targetfolder}/samples/{species}.{chromosome}.{segsize}.{wordlen}.samples"
         # print(f"echo 'sp,chr,loc,score,msp,mchr,mloc,orientation' > {sampleFilePath}.csv")
         print(f"python sample_query.py --query {sampleFilePath} --index {targetindex} >> {sampleFilePath}.csv")
 
-    # put all result in single CSV
-    resultsFile = f"{targetfolder}_max/data.csv"
-    print(f"echo 'sp,chr,sloc,score,msp,mchr,mloc,orientation,segsize,dsSO,dsEO' > {resultsFile}")
-    print(f"cat {targetfolder}_max/*.samples.csv >> {resultsFile}")
+    # put all result in single CSV, or a Parquet folder with the species as partitions, of the max score results
+    # written as Parquet files (the max score CSV files have a header line and row numbers)
+    if resultsformat == "parquet":
+        print(f"python max_score.py --csv_folder {targetfolder}/samples --max_csv_folder {targetfolder}_max --format parquet")
+        print(f"python results_store.py --output {targetfolder}_max/data.parquet \"{targetfolder}_max/*.samples.parquet\"")
+    else:
+        resultsFile = f"{targetfolder}_max/data.csv"
+        print(f"echo 'sp,chr,sloc,score,msp,mchr,mloc,orientation,segsize,dsSO,dsEO' > {resultsFile}")
+        print(f"cat {targetfolder}_max/*.samples.csv >> {resultsFile}")
 
 #
 #  Cases tested:
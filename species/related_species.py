@@ -1,15 +1,27 @@
+import numpy as np
 import pandas as pd
 import altair as alt
 import itertools
+import os
+
+from script_tools.results_store import above_mean_chunks, concat_results, read_chunks
+
+READ_COLUMNS = ['sp', 'chr', 'segloc', 'score', 'msp', 'mchr', 'mloc', 'orientation', 'segsize']
+FILTER_READ_COLUMNS = ['sp', 'chr', 'loc', 'score', 'msp', 'mchr', 'mloc', 'orientation', 'segsize', 'dsSO', 'dsEO']
 
 class RelatedSpecies:
-    def __init__(self, df):
+    def __init__(self, df, relationship_count=None):
+        """'relationship_count' from read_relationship_counts, instead of counting the records of 'df'"""
         self.df = df
         self.species_df = {}
-        modified_df = df.drop(['loc', 'mloc'], axis=1)
-        modified_df['count'] = 1
-        self.relationship_count = modified_df.groupby(['sp', 'chr', 'msp', 'mchr']).sum()
-        self.species_list = sorted(df['sp'].unique())
+        # number of records of each (sp, chr, msp, mchr), with a sorted index
+        if relationship_count is None:
+            relationship_count = df.groupby(['sp', 'chr', 'msp', 'mchr'], observed=True).size().to_frame('count')
+        self.relationship_count = relationship_count.sort_index()
+        # the part of relationship_count for each (sp, msp), and its counts indexed by (chr, mchr)
+        self.pair_relationships = {pair: pair_df for pair, pair_df in self.relationship_count.groupby(level=['sp', 'msp'], observed=True)}
+        self.pair_counts = {pair: pair_df['count'].droplevel(['sp', 'msp']) for pair, pair_df in self.pair_relationships.items()}
+        self.species_list = sorted(self.relationship_count.index.unique('sp') if df is None else df['sp'].unique())
         self.chr_order = {}
 
     def setChromosomeOrder(self, species, chromosomes):
@@ -25,7 +37,7 @@ class RelatedSpecies:
 
     def chromosome_relationships(self):
         for sp1, sp2 in itertools.combinations(self.species_list, 2):
-            yield sp1, sp2, self.relationship_count.query(f"sp == '{sp1}' & msp == '{sp2}'")
+            yield sp1, sp2, self.pair_relationships.get((sp1, sp2), self.relationship_count.iloc[:0])
 
     def getSpecies(self, species):
         if species not in self.species_df:
@@ -40,15 +52,17 @@ class RelatedSpecies:
         df = self.getSpecies(species)
         return df[df['chr'] != df['mchr']]
 
+    def pair_count_matrix(self, sp1, sp2):
+        """counts of related records for every pair of chromosomes in chr_order, a Series indexed by (chr, mchr)"""
+        pairs = pd.MultiIndex.from_product([self.chr_order[sp1], self.chr_order[sp2]], names=['chr', 'mchr'])
+        counts = self.pair_counts.get((sp1, sp2))
+        if counts is None:
+            return pd.Series(0, index=pairs, name='count')
+        return counts.reindex(pairs, fill_value=0)
+
     def xspecies_relationships(self, sp1, sp2):
-        df = self.relationship_count
-        for chr1 in self.chr_order[sp1]:
-            for chr2 in self.chr_order[sp2]:
-                xdf = df.query(f"sp == '{sp1}' & chr == '{chr1}' & msp == '{sp2}' & mchr == '{chr2}'")
-                count = 0
-                if len(xdf) > 0:
-                    count = xdf.iloc[0]['count']
-                yield sp1, chr1, sp2, chr2, count
+        for (chr1, chr2), count in self.pair_count_matrix(sp1, sp2).items():
+            yield sp1, chr1, sp2, chr2, count
 
     def getChromosomeRelationships(self, sp1, sp2, min_record_count=1):
         """Count related records between two species.
@@ -59,17 +73,10 @@ class RelatedSpecies:
             sp2 -- species 2 chromosome names
             count -- count of related records between the two (determined by elasticsearch results, in csv)
         """
-        counts = []
-        ax1chrs = []
-        ax2chrs = []
-        for sp1, chr1, sp2, chr2, count in self.xspecies_relationships(sp1, sp2):
-            ax1chrs.append(chr1)
-            ax2chrs.append(chr2)
-            counts.append(count)
-
-        source = pd.DataFrame({sp1: ax1chrs,
-                               sp2: ax2chrs,
-                               'count': counts})
+        counts = self.pair_count_matrix(sp1, sp2)
+        source = pd.DataFrame({sp1: counts.index.get_level_values('chr'),
+                               sp2: counts.index.get_level_values('mchr'),
+                               'count': counts.to_numpy()})
         if min_record_count > 0:
             source = source[source['count'] >= min_record_count]
         return source
@@ -85,22 +92,31 @@ class RelatedSpecies:
             score -- Elasticsearch scoring
             orientation -- distinguish 'same' from 'inversed' (reverse complement)
 
-        The score, loc, and mloc fields are 'int' data type
+        The score, loc, and mloc fields are 'int' data type, the names are categoricals
+
+        A .parquet or .arrow results file (see script_tools/results_store.py) can be read too.  The file is read
+        in chunks, only records above the mean score are kept, see results_store.above_mean_chunks.
         """
-        compression = "gzip" if csvFile.endswith(".gz") else None
-        df = pd.read_csv(csvFile,
-                        compression=compression,
-                        index_col=False,
-                        usecols=['sp','chr','segloc','score','msp','mchr','mloc','orientation','segsize'],
-                        dtype={ 'sp': str, 'chr': str, 'segloc': int,
-                                'score': int,
-                                'msp': str, 'mchr': str, 'mloc': int,
-                                'orientation': str, 'segsize': int, 'dsSO': int, 'dsEO': int })
-        mean_score = int(df['score'].mean())
-        return df[df['score'] > mean_score]
+        return concat_results(above_mean_chunks(csvFile, RelatedSpecies.read_chunks(csvFile), READ_COLUMNS), READ_COLUMNS)
+
+    @staticmethod
+    def read_chunks(csvFile, names=None):
+        """chunks(columns) function for read_chunks of 'csvFile', results files have loc where the CSV file has segloc"""
+        return lambda columns: read_chunks(csvFile, columns, names or {'segloc': 'loc'})
+
+    @staticmethod
+    def read_relationship_counts(csvFile):
+        """relationship_count for RelatedSpecies, counted chunk by chunk from the records of 'csvFile' kept by read_csv"""
+        keys = ['sp', 'chr', 'msp', 'mchr']
+        counts = [chunk.groupby(keys, observed=True).size().rename('count').reset_index()
+                  for chunk in above_mean_chunks(csvFile, RelatedSpecies.read_chunks(csvFile), keys + ['score'])]
+        if not counts:
+            return pd.DataFrame({column: [] for column in keys + ['count']}).set_index(keys)
+        df = pd.concat(counts, ignore_index=True).astype({column: str for column in keys})
+        return df.groupby(keys)[['count']].sum()
 
     @staticmethod
-    def read_csv_with_filter(csvFile, recordFilter=None):
+    def read_csv_with_filter(csvFile, recordFilter=None, chunkFilter=None):
         """Read CSV file that resulted from Elasticsearch scoring of relationships.
 
         Returns DataFrame with columns:
@@ -110,56 +126,169 @@ class RelatedSpecies:
             score -- Elasticsearch scoring
             orientation -- distinguish 'same' from 'inversed' (reverse complement)
 
-        The score, loc, and mloc fields are 'int' data type
+        The score, loc, and mloc fields are 'int' data type, the names are categoricals
+
+        The file is read in chunks, 'chunkFilter' is applied to each chunk as it is read, 'recordFilter' to all
+        the records read.
         """
-        df = pd.read_csv(csvFile,
-                           index_col=False,
-                           usecols=['sp','chr','loc','score','msp','mchr','mloc','orientation', 'segsize', 'dsSO', 'dsEO'],
-                           dtype={'sp': str, 'chr': str, 'loc': int,
-                                  'score': int,
-                                  'msp': str, 'mchr': str, 'mloc': int,
-                                  'orientation': str, 'segsize': int, 'dsSO': int, 'dsEO': int })
+        chunks = read_chunks(csvFile, FILTER_READ_COLUMNS)
+        if chunkFilter is not None:
+            chunks = (chunkFilter(chunk) for chunk in chunks)
+        df = concat_results(chunks, FILTER_READ_COLUMNS)
         if recordFilter is not None:
             df = recordFilter(df)
         return df
 
+PAIR_COLUMNS = ['sp', 'chr', 'msp', 'mchr']
+SECTION_COLUMNS = ['orientation', 'sp', 'chr', 'start_sloc', 'end_sloc', 'msp', 'mchr', 'start_mloc', 'end_mloc', 'segments']
+# the output section of the experiment configuration, see experiments/configurations/example_full.config.yaml
+DEFAULT_SECTION_OUTPUT = {'translocations': {'min_consecutive_segments': 2}, 'inversions': {'min_consecutive_segments': 2}}
+
+
+def best_matches(df, segment_size):
+    """The highest scoring record for each sampled location of every chromosome pair, sorted by pair and location.
+
+    Adds 'sloc', the sampled segment number, and replaces 'mloc' with the matched segment number.
+    """
+    df = df.reset_index(drop=True)
+    best = df.loc[df.groupby(PAIR_COLUMNS + ['loc'], observed=True, sort=True)['score'].idxmax()].reset_index(drop=True)
+    best['sloc'] = (best['loc'] // segment_size).astype('int64')
+    best['mloc'] = (best['mloc'] // segment_size).astype('int64')
+    return best
+
+
+def pair_starts(df):
+    """True for the first record of each chromosome pair in sorted 'df'"""
+    first = np.zeros(len(df), dtype=bool)
+    first[:1] = True
+    for column in PAIR_COLUMNS:
+        values = df[column].to_numpy()
+        first[1:] |= values[1:] != values[:-1]
+    return first
+
+
+def step_markers(mloc, first, step):
+    """True where 'mloc' is the previous one plus 'step', or the same, within a chromosome pair"""
+    mloc = np.asarray(mloc)
+    markers = np.zeros(len(mloc), dtype=bool)
+    difference = mloc[1:] - mloc[:-1]
+    markers[1:] = ((difference == step) | (difference == 0)) & ~first[1:]
+    return markers
+
+
+def marker_runs(markers, minimum_consecutive):
+    """(starts, ends) of maximal runs of True 'markers', starting at the record before the first marker,
+    with at least 'minimum_consecutive' records"""
+    edges = np.diff(np.concatenate(([0], np.asarray(markers, dtype=np.int8), [0])))
+    starts = np.flatnonzero(edges == 1) - 1
+    ends = np.flatnonzero(edges == -1) - 1
+    keep = ends - starts + 1 >= minimum_consecutive
+    return starts[keep], ends[keep]
+
+
+def sections(best, starts, ends):
+    """DataFrame with a section for each run from 'starts' to 'ends' in 'best'"""
+    start = best.iloc[starts].reset_index(drop=True)
+    end = best.iloc[ends].reset_index(drop=True)
+    return pd.DataFrame({'orientation': np.where(start['mloc'] < end['mloc'], 'same', 'inversed'),
+                         'sp': start['sp'], 'chr': start['chr'], 'start_sloc': start['sloc'], 'end_sloc': end['sloc'],
+                         'msp': start['msp'], 'mchr': start['mchr'], 'start_mloc': start['mloc'], 'end_mloc': end['mloc'],
+                         'segments': ends - starts + 1}, columns=SECTION_COLUMNS)
+
+
+def structural_sections(df, segment_size, output=None):
+    """DataFrame of sections of consecutive segments matched in order, for all chromosome pairs in 'df' at once.
+
+    Runs where the matched segment steps by +1 (or 0) are found with at least the translocations
+    min_consecutive_segments, runs stepping by -1 (or 0) with at least the inversions one, from 'output',
+    the output section of an experiment configuration.  Same orientation runs come first.
+    """
+    output = DEFAULT_SECTION_OUTPUT if output is None else output
+    best = best_matches(df, segment_size)
+    first = pair_starts(best)
+    found = []
+    for step, kind in [(1, 'translocations'), (-1, 'inversions')]:
+        minimum = output.get(kind, {}).get('min_consecutive_segments', DEFAULT_SECTION_OUTPUT[kind]['min_consecutive_segments'])
+        found.append(sections(best, *marker_runs(step_markers(best['mloc'], first, step), minimum)))
+    return pd.concat(found, ignore_index=True)
+
+
 class StructuralRelationships:
     def __init__(self, df, sp1, ch1, sp2, ch2, segment_size):
-        df = df.query(f"sp == '{sp1}' & chr == '{ch1}' & msp == '{sp2}' & mchr == '{ch2}'")
-        groups = df.groupby(by=['loc'])
-        df = groups.apply(lambda g: g[g['score'] == g['score'].max()])
-        df['sloc'] = (df['loc']/segment_size).astype('int64')
-        df['mloc'] = (df['mloc']/segment_size).astype('int64')
+        df = df[(df['sp'] == sp1) & (df['chr'] == ch1) & (df['msp'] == sp2) & (df['mchr'] == ch2)]
+        df = best_matches(df, segment_size)
         self.df = df
-        self.same = (df.mloc == (df.mloc.shift() + 1)) | (df.mloc == df.mloc.shift())
-        self.inversed = (df.mloc == (df.mloc.shift() - 1)) | (df.mloc == df.mloc.shift())
+        first = pair_starts(df)
+        self.same = pd.Series(step_markers(df['mloc'], first, 1), index=df.index)
+        self.inversed = pd.Series(step_markers(df['mloc'], first, -1), index=df.index)
 
     def similar_sections(self, minimum):
-        rawdata = []
-        for s, e, o in itertools.chain(self.ss(self.same, minimum, "same"), self.ss(self.inversed, minimum, "inversed")):
-            srec = self.df.iloc[s]
-            erec = self.df.iloc[e]
-            orientation = "same" if srec.mloc < erec.mloc else "inversed"
-            yield orientation, srec.sp, srec.chr, srec.sloc, erec.sloc, srec.msp, srec.mchr, srec.mloc, erec.mloc
-
+        runs = [marker_runs(self.same, minimum), marker_runs(self.inversed, minimum)]
+        found = pd.concat([sections(self.df, starts, ends) for starts, ends in runs], ignore_index=True)
+        yield from found.drop(columns='segments').itertuples(index=False, name=None)
 
     def ss(self, markers, minimum_consecutive, orientation):
-        start = None
-        end = None
-        for i, v in enumerate(markers):
-            if v:
-                end = i
-                if start is None:
-                    start = i - 1
-            elif start is not None:
-                if (abs(end - start) + 1) >= minimum_consecutive:
-                    yield(start, end, orientation)
-                start = end = None
+        for start, end in zip(*marker_runs(markers, minimum_consecutive)):
+            yield start, end, orientation
+
+
+DEFAULT_BIN_SIZE = 1000000
+# folder the chart data files are written to, see chart_data
+DEFAULT_CHART_FOLDER = 'chart_data'
+# y of the chromosome lines in comparison charts
+TOP_Y, MIDDLE_Y, BOTTOM_Y = 400, 200, 0
+
+
+def location_column(df):
+    """'loc', or 'segloc' in DataFrames from RelatedSpecies.read_csv"""
+    return 'loc' if 'loc' in df.columns else 'segloc'
+
+
+def binned_links(df, bin_size=DEFAULT_BIN_SIZE):
+    """Number of records in 'df' for each (msp, mchr, orientation) and pair of 'bin_size' bp location bins.
+
+    Returns DataFrame with columns msp, mchr, orientation, x, x2 and count, where x and x2 are the
+    start of the location bin and of the matching location bin, in million bp.
+    """
+    binned = pd.DataFrame({'msp': df['msp'].to_numpy(), 'mchr': df['mchr'].to_numpy(),
+                           'orientation': df['orientation'].to_numpy(),
+                           'bin': df[location_column(df)].to_numpy() // bin_size, 'mbin': df['mloc'].to_numpy() // bin_size})
+    links = binned.groupby(['msp', 'mchr', 'orientation', 'bin', 'mbin'], observed=True).size().rename('count').reset_index()
+    return pd.DataFrame({'msp': links['msp'].astype(str), 'mchr': links['mchr'].astype(str),
+                         'orientation': links['orientation'].astype(str),
+                         'x': links['bin'] * bin_size / 1000000, 'x2': links['mbin'] * bin_size / 1000000,
+                         'count': links['count']})
+
+
+def chart_data(df, name, folder=DEFAULT_CHART_FOLDER, url=None):
+    """Data for alt.Chart, 'df' written to '<folder>/<name>.json' and referenced by URL, so notebooks and web pages
+    do not embed it.  With no 'folder' returns 'df'.
+
+    'url' is the URL of 'folder' from the page.  By default it is the path of 'folder' relative to the working
+    directory, where the notebook is served from, a folder outside of it needs a 'url'.
+    """
+    if folder is None:
+        return df
+    if url is None:
+        url = os.path.relpath(folder)
+        if url == os.pardir or url.startswith(os.pardir + os.sep):
+            raise ValueError(f"chart data folder {folder} is not in the working directory, its URL from the page is needed")
+        url = url.replace(os.sep, '/')
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f"{name}.json")
+    df.to_json(f"{path}.tmp", orient='records')
+    os.replace(f"{path}.tmp", path)
+    return alt.UrlData(url=f"{url.rstrip('/')}/{name}.json", format=alt.DataFormat(type='json'))
 
 
 class SpeciesGraphs:
-    def __init__(self, related_species):
+    def __init__(self, related_species, folder=DEFAULT_CHART_FOLDER, url=None, bin_size=DEFAULT_BIN_SIZE):
+        """chart data files are written to 'folder', which must be served with the notebook or web page, at the URL
+        'url' (see chart_data), or with folder=None the data is in the charts"""
         self.related_species = related_species
+        self.folder = folder
+        self.url = url
+        self.bin_size = bin_size
 
     def chromosomeRelationships(self, sp1, sp2):
         """Heatmap of related chromosomes between two species"""
@@ -167,12 +296,31 @@ class SpeciesGraphs:
         ax1_title = f"{sp1} chromosomes"
         ax2_title = f"{sp2} chromosomes"
         chr_map = self.related_species.chr_order
-        return alt.Chart(source).mark_rect().encode(
+        return alt.Chart(chart_data(source, f"{sp1}_{sp2}_counts", self.folder, self.url)).mark_rect().encode(
             x=alt.X(f"{sp1}:N", sort=chr_map[sp1], axis=alt.Axis(title=ax1_title, grid=True, ticks=True)),
             y=alt.Y(f"{sp2}:N", sort=chr_map[sp2], axis=alt.Axis(title=ax2_title, grid=True, ticks=True)),
             color=alt.Color('count:Q', title="count")
         )
 
+    def dotPlotDF(self, sp1, chr1, sp2, chr2, min_score=0):
+        """number of records for each pair of location bins of two chromosomes, see binned_links"""
+        df = self.related_species.df
+        if df is None:
+            raise ValueError("dot plots need the records, RelatedSpecies was made with relationship counts only")
+        df = df[(df['sp'] == sp1) & (df['chr'] == chr1) & (df['msp'] == sp2) & (df['mchr'] == chr2) & (df['score'] >= min_score)]
+        return binned_links(df, self.bin_size).drop(columns=['msp', 'mchr'])
+
+    def chromosomeDotPlot(self, sp1, chr1, sp2, chr2, min_score=0):
+        """Dot plot of the locations of related records of two chromosomes, binned by bin_size"""
+        source = self.dotPlotDF(sp1, chr1, sp2, chr2, min_score)
+        name = f"{sp1}_{chr1}_{sp2}_{chr2}_{self.bin_size}_{min_score}_dots"
+        return alt.Chart(chart_data(source, name, self.folder, self.url)).mark_square().encode(
+            x=alt.X('x:Q', axis=alt.Axis(title=f"{sp1} {chr1}, million bp")),
+            y=alt.Y('x2:Q', axis=alt.Axis(title=f"{sp2} {chr2}, million bp")),
+            color=alt.Color('orientation:N', title='', scale=ChromosomeGraphs.color_scale),
+            opacity=alt.Opacity('count:Q', title="count", scale=alt.Scale(range=[0.2, 1]))
+        )
+
 
 class ChromosomeGraphs:
     domains = ['same', 'inversed']
@@ -181,88 +329,65 @@ class ChromosomeGraphs:
         range=['#6baed6', '#fcae91']
     )
 
-    def __init__(self, related_species):
+    def __init__(self, related_species, folder=DEFAULT_CHART_FOLDER, url=None, bin_size=DEFAULT_BIN_SIZE):
+        """chart data files are written to 'folder', which must be served with the notebook or web page, at the URL
+        'url' (see chart_data), or with folder=None the data is in the charts"""
         self.related_species = related_species
+        self.folder = folder
+        self.url = url
+        self.bin_size = bin_size
 
     def comparisionDF(self, species, chromosome, sp2, sp3, min_score=1000, min_records=10):
-        """get one or more DataFrame with relationships that meet the conditions"""
-        pass
-
-# def cgraph(df, top_species, top_chromosome, middle_species, middle_chromosome, bottom_species, bottom_chromosome,
-#            graph_width=600):
-#     g = alt.Chart(df).mark_line().encode(
-#         x=alt.X('x', axis=alt.Axis(grid=False)),
-#         y=alt.Y('y', axis=alt.Axis(grid=False)),
-#         x2='x2',
-#         y2='y2',
-#         color=alt.Color('orientation:N', title='', scale=color_scale)
-#     )
-#
-#     maxes = df.max()
-#     maxCenter = maxes['x']
-#     maxRest = maxes['x2']
-#     maxY = max(maxes['y'], maxes['y2'])
-#
-#     # here I just want a bar at the top, and text on the right that says:  species, chromosome
-#     # top_data + bars, gives me a transparent green bar at top, with no text
-#     top_label = f"{top_species}, {top_chromosome}"
-#     middle_label = f"{middle_species}, {middle_chromosome}"
-#     bottom_label = f"{bottom_species}, {bottom_chromosome}"
-#     X_MARGIN = 10
-#     Y_MARGIN = 12
-#     top_data = pd.DataFrame({
-#         'x': [maxRest + X_MARGIN, maxRest + X_MARGIN, maxRest + X_MARGIN],
-#         'y': [maxY - Y_MARGIN, int(maxY / 2), Y_MARGIN],
-#         'text': [top_label, middle_label, bottom_label]
-#     })
-#     bars = alt.Chart(top_data).mark_text(
-#         stroke='grey',
-#         opacity=0.9,
-#         fontSize=10,
-#         fontStyle="italic",
-#         align="left"
-#     ).encode(
-#         x=alt.X('x:Q'),
-#         y=alt.Y('y:Q'),
-#         text=alt.Text('text'),
-#         color=alt.Color('orientation:N', legend=None, scale=color_scale)
-#     )
-#
-#     x = alt.Chart().mark_text().encode(
-#         x=alt.X('x:Q', axis=alt.Axis(title='million bp', grid=False, ticks=True)),
-#         y=alt.Y('y:Q', axis=alt.Axis(title='', grid=False, labels=False, ticks=False)),
-#         color=alt.Color('orientation:N', legend=alt.Legend(orient="left", title='', symbolType="stroke"),
-#                         scale=color_scale)
-#     )
-#
-#     return alt.layer(x, bars, g).configure_view(
-#         stroke='transparent',
-#         width=graph_width
-#     ).configure_axis(grid=False)
-#
-#
-# def sp_to_y(val, top, mid, bot):
-#     if val == bot:
-#         return 0
-#     elif val == mid:
-#         return 200
-#     else:
-#         return 400
-#
-#
-# def mod_df(df, top_sp, top_chr, middle_sp, middle_chr, bottom_sp, bottom_chr, min_score=1000):
-#     df = df[df['sp'] == middle_sp]
-#     df = df[df['score'] > min_score]
-#     df = df[df['chr'] == middle_chr]
-#     df = df[(df['mchr'] == top_chr) | (df['mchr'] == bottom_chr)]
-#     df['x'] = [x / 1000000 for x in df['loc']]
-#     df['x2'] = [x / 1000000 for x in df['mloc']]
-#     df['y'] = [sp_to_y(val, top_sp, middle_sp, bottom_sp) for val in df['sp']]
-#     df['y2'] = [sp_to_y(val, top_sp, middle_sp, bottom_sp) for val in df['msp']]
-#     return df
-#
-#
-# def graph_df(df, top_sp, top_chr, middle_sp, middle_chr, bottom_sp, bottom_chr, min_score=1000, graph_width=600):
-#     df = mod_df(df, top_sp, top_chr, middle_sp, middle_chr, bottom_sp, bottom_chr, min_score)
-#     return cgraph(df, top_sp, top_chr, middle_sp, middle_chr, bottom_sp, bottom_chr, graph_width)
-#
+        """Binned links (see binned_links) from a chromosome of 'species' to the chromosomes of 'sp2' and 'sp3'
+        with at least 'min_records' records scoring at least 'min_score'.
+
+        The matching chromosomes of each species are laid end to end, in chr_order when it is set,
+        'x2' is the location on that line and 'offset' where the chromosome starts on it, in million bp.
+        """
+        df = self.related_species.df
+        if df is None:
+            raise ValueError("comparison graphs need the records, RelatedSpecies was made with relationship counts only")
+        df = df[(df['sp'] == species) & (df['chr'] == chromosome) & df['msp'].isin([sp2, sp3]) & (df['score'] >= min_score)]
+        links = binned_links(df, self.bin_size)
+        totals = links.groupby(['msp', 'mchr'])['count'].transform('sum')
+        links = links[totals >= min_records]
+        lengths = links.groupby(['msp', 'mchr'])['x2'].max() + self.bin_size / 1000000
+        offsets = []
+        for msp, msp_lengths in lengths.groupby(level='msp'):
+            msp_lengths = msp_lengths.droplevel('msp')
+            order = [chr for chr in self.related_species.chr_order.get(msp, []) if chr in msp_lengths.index]
+            msp_lengths = msp_lengths.reindex(order + sorted(set(msp_lengths.index) - set(order)))
+            offsets.append(pd.DataFrame({'msp': msp, 'mchr': msp_lengths.index,
+                                         'offset': msp_lengths.cumsum().to_numpy() - msp_lengths.to_numpy()}))
+        if not offsets:
+            return links.assign(offset=pd.Series(dtype=float))
+        links = links.merge(pd.concat(offsets, ignore_index=True), on=['msp', 'mchr'])
+        return links.assign(x2=links['x2'] + links['offset'])
+
+    def comparisonChart(self, species, chromosome, sp2, sp3, min_score=1000, min_records=10, graph_width=600):
+        """Lines from a chromosome of 'species' in the middle to the chromosomes of 'sp2' above and 'sp3' below"""
+        source = self.comparisionDF(species, chromosome, sp2, sp3, min_score, min_records)
+        source = source.assign(y=MIDDLE_Y, y2=np.where(source['msp'] == sp2, TOP_Y, BOTTOM_Y))
+        name = f"{species}_{chromosome}_{sp2}_{sp3}_{self.bin_size}_{min_score}_{min_records}_links"
+        columns = ['orientation', 'x', 'y', 'x2', 'y2', 'count']
+        links = alt.Chart(chart_data(source[columns], name, self.folder, self.url)).mark_rule().encode(
+            x=alt.X('x:Q', axis=alt.Axis(title='million bp', grid=False, ticks=True)),
+            y=alt.Y('y:Q', axis=None),
+            x2='x2:Q',
+            y2='y2:Q',
+            color=alt.Color('orientation:N', title='', scale=self.color_scale),
+            opacity=alt.Opacity('count:Q', title="count", scale=alt.Scale(range=[0.1, 0.8]))
+        )
+        # a label at the start of each chromosome, the few rows are kept in the chart
+        starts = source.drop_duplicates(['msp', 'mchr'])
+        labels = pd.DataFrame({'x': [0.0] + list(starts['offset']),
+                               'y': [MIDDLE_Y] + list(starts['y2']),
+                               'text': [f"{species}, {chromosome}"] + [f"{msp}, {mchr}" for msp, mchr in zip(starts['msp'], starts['mchr'])]})
+        text = alt.Chart(labels).mark_text(fontSize=10, fontStyle="italic", align="left", dy=-6).encode(
+            x='x:Q',
+            y='y:Q',
+            text='text:N'
+        )
+        return alt.layer(links, text).properties(width=graph_width).configure_view(
+            stroke='transparent'
+        ).configure_axis(grid=False)
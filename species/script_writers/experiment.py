@@ -143,7 +143,7 @@ class Configuration:
 
     # ES specific
     def install(self):
-        return self.configuration["install"]
+        return self.configuration.get("install")
 
     def run(self):
         return self.experiment.env_expand(self.configuration["run"])
@@ -155,10 +155,11 @@ class Configuration:
         return self.experiment.env_expand(self.configuration["sample_file_pattern"])
 
     def configure(self):
-        return self.experiment.env_expand(self.configuration["configure"])
+        return self.experiment.env_expand(self.configuration.get("configure"))
 
     def is_started(self):
-        return self.experiment.env_expand(self.configuration["is_started"])
+        """script checking whether the step already ran, None when not configured"""
+        return self.experiment.env_expand(self.configuration.get("is_started"))
 
     # segment specification
     def segment_size(self):
@@ -167,6 +168,10 @@ class Configuration:
     def minimum_number_words(self):
         return self.configuration["segment"]["minimum_number_words"]
 
+    def workers(self):
+        """number of worker processes, None when not configured"""
+        return self.configuration.get("workers")
+
     def script_line(self, s):
         if s in self.configuration:
             return self.experiment.env_expand(self.configuration[s])
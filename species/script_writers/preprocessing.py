@@ -19,45 +19,27 @@ def preprocessing_script(script_output_folder, experiment, configuration, transf
     else:
         print(f"Writing preprocessing script to {output_file_path}")
 
-        with open(f"{output_file_path}", "w") as outFile, open(input_data) as inFile:
-            lines = inFile.readlines()
+        with open(f"{output_file_path}", "w") as outFile:
             outFile.write(f"mkdir -p {target_folder}/{experiment.title()}/processed\n")
             outFile.write(f"mkdir -p {target_folder}/{experiment.title()}/samples\n")
-            species_set = set()
-            counter = 0
-            total = len(lines)
-            for line in lines:
-                counter += 1
-                species, chromosome, filePath = line.strip().split()
-                species_set.add(species)
-                outFile.write(f"echo 'processing file {filePath} ({counter} of {total})'\n")
-                outFile.write(f"python {tool_folder}/processing.py {species} {chromosome} {filePath} {segment_size} ")
-                outFile.write(f"{min_word_length} {target_folder}/{experiment.title()} {sample_size_percent} {number_samples} {minimum_number_words}")
-                outFile.write("\n")
-                # optional additional parameters: {ndel} {ndellen}")
-
-            outFile.write("#\n")
-            outFile.write("# count of expected elasticsearch records per species\n")
-            outFile.write("#\n")
-            for species in species_set:
-                processed_path = f"{target_folder}/{experiment.title()}/processed"
-                outFile.write(f"cat {processed_path}/{species}.*.processed | wc > {processed_path}/{species}.line_count\n")
+            outFile.write(f"python {tool_folder}/parallel_processing.py --files {input_data} --segsize {segment_size} ")
+            outFile.write(f"--wordlen {min_word_length} --targetfolder {target_folder}/{experiment.title()} ")
+            outFile.write(f"--samplesizepercent {sample_size_percent} --numbersamples {number_samples} --minwords {minimum_number_words}")
+            workers = configuration.workers()
+            if workers is not None:
+                outFile.write(f" --workers {workers}")
+            outFile.write("\n")
+            # optional additional parameters: --ndel {ndel} --ndellen {ndellen}
 
 
 def query_with_samples(script_output_folder, experiment, configuration):
     output_file_path = f"{script_output_folder}/query_samples.sh"
     tool_folder = experiment.tool_folder()
-    processed_folder = experiment.processed_folder()
     if os.path.isfile(output_file_path):
         print(f"SKIPPING sample_query script generation, script {output_file_path} already exists")
     else:
         print(f"Writing preprocessing script to {output_file_path}")
         with open(f"{output_file_path}", "w") as outFile:
-            outFile.write("#\n")
-            outFile.write("# wait for elasticsearch load to complete\n")
-            outFile.write("#\n")
-            outFile.write(f"python {tool_folder}/wait_for_es_load_complete.py {processed_folder} {experiment.elasticsearch_url()} {experiment.title()}\n")
-
             outFile.write("#\n")
             outFile.write("# generate the query script\n")
             outFile.write("#\n")
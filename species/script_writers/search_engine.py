@@ -6,7 +6,7 @@ import os
 def script(outFile, comment, command):
     outFile.write("#\n")
     if not command:
-        outFile.write(f"# SKIPPING, not configured: {comment}")
+        outFile.write(f"# SKIPPING, not configured: {comment}\n")
     else:
         outFile.write(f"# {comment}\n")
         outFile.write("#\n")
@@ -47,6 +47,12 @@ def search_engine_script(script_output_folder, experiment, configuration):
             outFile.write("# END OF GENERATED SCRIPT")
 
 
+def loader_scripts(outFile, configuration):
+    script(outFile, "Install the search engine loader", configuration.install())
+    script(outFile, "Configure the loader", configuration.configure())
+    script(outFile, "Run the search engine loader", configuration.run())
+
+
 def search_engine_loader_script(script_output_folder, experiment, configuration):
     output_file_path = f"{script_output_folder}/search_engine_loader.sh"
     if os.path.isfile(output_file_path):
@@ -56,9 +62,10 @@ def search_engine_loader_script(script_output_folder, experiment, configuration)
         with open(f"{output_file_path}", "w") as outFile:
             outFile.write(f"# {experiment.timestamp}, generated by script_writer.py\n")
 
-            with Condition(configuration.is_started(), outFile).not_condition():
-                script(outFile, "Install the search engine loader", configuration.install())
-                script(outFile, "Configure the loader", configuration.configure())
-                script(outFile, "Run the search engine loader", configuration.run())
+            if configuration.is_started() is None:
+                loader_scripts(outFile, configuration)
+            else:
+                with Condition(configuration.is_started(), outFile).not_condition():
+                    loader_scripts(outFile, configuration)
 
             outFile.write("# END OF GENERATED SCRIPT")
\ No newline at end of file